@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import numpy
+
+
+def default_cache_dir():
+    '''
+    Shared by every GUI, override with ASTRO_IMAGE_SIM_CACHE
+    '''
+    return os.environ.get('ASTRO_IMAGE_SIM_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'astro_image_sim'))
+
+
+class ArrayCache:
+    '''
+    On-disk cache of decoded images as .npy files, keyed by the content
+    hash of the source file. Hits are opened as read-only numpy.memmaps, so
+    they cost no decoding and no copy. To use:
+    cache = ArrayCache()
+    im = cache.load('galaxy_images/im1.jpg', misc.imread)
+    The hash of a file is only recomputed when its mtime or size changes.
+    '''
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # abspath -> [mtime, size, content hash]
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        # array path -> lock held while that array is decoded and written
+        self.writing = {}
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (IOError, ValueError):
+            self.index = {}
+    def content_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            known = self.index.get(path)
+        if known is not None and known[0] == stat.st_mtime and known[1] == stat.st_size:
+            return known[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        with self.lock:
+            self.index[path] = [stat.st_mtime, stat.st_size, digest.hexdigest()]
+            self.save_index()
+        return digest.hexdigest()
+    def save_index(self):
+        # Written to a temporary file first, other GUIs may be reading it
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.index, f)
+        os.rename(tmp_path, self.index_path)
+    def array_path(self, path):
+        return os.path.join(self.cache_dir, self.content_hash(path) + '.npy')
+    def open_array(self, array_path):
+        '''
+        Read-only memmap of a cached array, or None if there is no usable one
+        '''
+        if not os.path.exists(array_path):
+            return None
+        try:
+            return numpy.load(array_path, mmap_mode='r')
+        except ValueError:
+            # Truncated by an interrupted write, decode again
+            return None
+    def load(self, path, decode):
+        '''
+        Returns the decoded array of path, calling decode(path) and storing
+        the result only on a miss. Threads missing on the same file wait
+        for the first one instead of decoding it again.
+        '''
+        array_path = self.array_path(path)
+        array = self.open_array(array_path)
+        if array is not None:
+            return array
+        with self.lock:
+            writing = self.writing.setdefault(array_path, threading.Lock())
+        with writing:
+            array = self.open_array(array_path)
+            if array is not None:
+                return array
+            image = numpy.ascontiguousarray(decode(path))
+            # Unique per writer, other processes may be writing the same array
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                numpy.save(f, image)
+            try:
+                os.rename(tmp_path, array_path)
+            except OSError:
+                # Another process got there first (rename does not replace
+                # on Windows): use its array
+                os.remove(tmp_path)
+                array = self.open_array(array_path)
+                if array is None:
+                    raise
+                return array
+        return numpy.load(array_path, mmap_mode='r')
@@ -0,0 +1,166 @@
+'''
+Headless version of the gui_assess calculation. For every combination of
+object size (degrees), image size (meters) and catalog image, computes the
+H2RG pixel scale and field of view, resamples the image and cuts out the
+field of view as a frame of the detector format, npix x npix. Like
+gui_assess, oversampled configurations (pixel scale finer than the image)
+are not resampled: they get a summary row with no frame. Runs across a
+process pool and writes one .npy frame per configuration plus a
+summary.csv. Example:
+python batch.py --objsize .01 .02 --imsize .05 .1 --images 'Galaxy Image 1' --out sweep
+'''
+from __future__ import print_function
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import re
+import time
+import numpy
+from arraycache import ArrayCache
+from backends import ACCURACY_TIERS, BACKENDS, get_backend
+from catalog import Catalog
+from instrument import Instrument
+from resample import ImageObject
+
+
+SUMMARY_FIELDS = ['image', 'objsize_deg', 'imsize_m', 'pixscale', 'fov',
+                  'oversampled', 'fov_too_large', 'rows', 'columns', 'seconds', 'frame']
+
+# Per process state, set up by init_worker
+_catalog = None
+_options = None
+# ImageObjects by image name, so every configuration of an image a worker
+# runs reuses the pyramid and spline coefficients already built
+_objects = {}
+
+
+def init_worker(manifest, options):
+    global _catalog, _options
+    _catalog = Catalog(manifest, ArrayCache())
+    _options = options
+    _objects.clear()
+
+
+def image_object(image_name):
+    '''
+    The worker's ImageObject of image_name, built on first use
+    '''
+    if image_name not in _objects:
+        entry = _catalog.entry(image_name)
+        # Parallelism comes from the process pool, so each resample is single threaded
+        _objects[image_name] = ImageObject(_catalog.load(image_name), entry.pixscale,
+                                           method=_options['method'], threads=1,
+                                           backend=_options['backend'])
+    return _objects[image_name]
+
+
+def frame_name(image_name, objsize, imsize):
+    return '%s_%g_%g.npy' % (re.sub('[^A-Za-z0-9]+', '_', image_name).strip('_'), objsize, imsize)
+
+
+def detector_frame(obj, pixscale, npix):
+    '''
+    npix x npix frame of obj at pixscale, centred on the image centre the
+    way the detector sees it. Detector pixels past the image edges, when
+    the field of view is too large, are dark sky (zero).
+    '''
+    half = npix * pixscale / 2.
+    frame, extent = obj.resampled_region(pixscale, (-half, half), (-half, half))
+    xpix = (extent[1] - extent[0]) / frame.shape[1]
+    ypix = (extent[3] - extent[2]) / frame.shape[0]
+    # Frame pixel under the top left detector pixel, rows run top down
+    row = int(round((extent[3] - half) / ypix))
+    col = int(round((-half - extent[0]) / xpix))
+    detector = numpy.zeros((npix, npix) + frame.shape[2:], dtype=frame.dtype)
+    rows = min(frame.shape[0] - max(row, 0), npix - max(-row, 0))
+    cols = min(frame.shape[1] - max(col, 0), npix - max(-col, 0))
+    if rows > 0 and cols > 0:
+        detector[max(-row, 0):max(-row, 0) + rows, max(-col, 0):max(-col, 0) + cols] = \
+            frame[max(row, 0):max(row, 0) + rows, max(col, 0):max(col, 0) + cols]
+    return detector
+
+
+def run_configuration(config):
+    '''
+    Resamples one catalog image for one (objsize, imsize) and returns its
+    summary row. Oversampled configurations are only screened.
+    '''
+    image_name, objsize, imsize = config
+    start = time.time()
+    obj = image_object(image_name)
+    screening = _options['instrument'].screen_image(objsize, imsize, obj)
+    pixscale = float(screening.pixscale)
+    fov = float(screening.fov)
+    row = {'image': image_name, 'objsize_deg': objsize, 'imsize_m': imsize,
+           'pixscale': pixscale, 'fov': fov,
+           'oversampled': bool(screening.oversampled),
+           'fov_too_large': bool(screening.fov_too_large),
+           'rows': 0, 'columns': 0, 'frame': ''}
+    if not screening.oversampled:
+        frame = detector_frame(obj, pixscale, _options['instrument'].npix)
+        path = os.path.join(_options['out'], frame_name(image_name, objsize, imsize))
+        numpy.save(path, frame)
+        row.update({'rows': frame.shape[0], 'columns': frame.shape[1], 'frame': path})
+    row['seconds'] = time.time() - start
+    return row
+
+
+def run_batch(configs, manifest='catalog.json', out='batch_output', processes=None,
+              method='spline', instrument=None, backend=None):
+    '''
+    Runs every (image name, objsize, imsize) in configs and writes the
+    frames and summary.csv to out. Returns the summary rows, sorted by image.
+    backend is a resampling backend or accuracy tier, see backends.py.
+    '''
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    if instrument is None:
+        instrument = Instrument()
+    # Tiers are resolved here, so the workers do not each calibrate
+    options = {'out': out, 'method': method, 'instrument': instrument,
+               'backend': get_backend(backend, method).name}
+    # Configurations of the same image next to each other reuse the page cache
+    configs = sorted(configs, key=lambda config: config[0])
+    pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(manifest, options))
+    try:
+        rows = pool.map(run_configuration, configs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    with open(os.path.join(out, 'summary.csv'), 'w') as f:
+        writer = csv.DictWriter(f, SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--objsize', type=float, nargs='+', required=True,
+                        help='object sizes in degrees')
+    parser.add_argument('--imsize', type=float, nargs='+', required=True,
+                        help='image sizes on the detector in meters')
+    parser.add_argument('--images', nargs='+',
+                        help='catalog image names, all available images by default')
+    parser.add_argument('--catalog', default='catalog.json', help='catalog manifest')
+    parser.add_argument('--out', default='batch_output', help='output directory')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, all cores by default')
+    parser.add_argument('--method', default='spline', choices=['spline', 'bin'])
+    parser.add_argument('--backend', choices=list(BACKENDS) + list(ACCURACY_TIERS),
+                        help='resampling backend or accuracy tier, overrides --method')
+    args = parser.parse_args()
+    images = args.images or Catalog(args.catalog).names()
+    configs = list(itertools.product(images, args.objsize, args.imsize))
+    start = time.time()
+    rows = run_batch(configs, args.catalog, args.out, args.processes, args.method,
+                     backend=args.backend)
+    print('%d configurations in %.1f s, summary in %s' %
+          (len(rows), time.time() - start, os.path.join(args.out, 'summary.csv')))
+
+
+if __name__ == "__main__":
+    main()
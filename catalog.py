@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from fitsimage import is_fits, open_fits
+from timing import timed
+
+
+class CatalogEntry:
+    '''
+    One image of the catalog. Nothing is read from disk until decode()
+    '''
+    def __init__(self, name, path, pixscale, category=None, array_cache=None):
+        self.name = name
+        self.path = path
+        self.pixscale = pixscale
+        self.category = category
+        self.array_cache = array_cache
+    def exists(self):
+        return os.path.exists(self.path)
+    @timed('decode')
+    def decode(self):
+        if is_fits(self.path):
+            # Already memory mapped, pixscale may come from the header
+            image, pixscale = open_fits(self.path)
+            if self.pixscale is None:
+                self.pixscale = pixscale
+            return image
+        # Imported on first decode, it is slow and unused for FITS files
+        from scipy import misc
+        if self.array_cache is not None:
+            return self.array_cache.load(self.path, misc.imread)
+        return misc.imread(self.path)
+
+
+class Catalog:
+    '''
+    Images listed in a JSON manifest of name, path (relative to the
+    manifest), pixscale (arcsecs/pix, null to read it from a FITS header)
+    and category records. To use:
+    catalog = Catalog('catalog.json', ArrayCache())
+    im = catalog.load('Galaxy Image 1')
+    catalog.prefetch(catalog.neighbours('Galaxy Image 1'))
+    With an ArrayCache, decoded images are kept on disk between sessions.
+    '''
+    def __init__(self, manifest='catalog.json', array_cache=None):
+        self.manifest = os.path.abspath(manifest)
+        root = os.path.dirname(self.manifest)
+        with open(manifest) as f:
+            records = json.load(f)
+        self.entries = OrderedDict()
+        for record in records:
+            self.entries[record['name']] = CatalogEntry(
+                record['name'], os.path.join(root, record['path']),
+                record['pixscale'], record.get('category'), array_cache)
+        # Decodes running or finished in the background, by name
+        self.prefetched = {}
+        self.lock = threading.Lock()
+        self.pool = None
+    def names(self):
+        '''
+        Names of the entries whose file is present, in manifest order
+        '''
+        return [name for name, entry in self.entries.items() if entry.exists()]
+    def entry(self, name):
+        return self.entries[name]
+    def load(self, name):
+        '''
+        Returns the decoded image, picking up a prefetch if there is one
+        '''
+        with self.lock:
+            pending = self.prefetched.pop(name, None)
+        if pending is not None:
+            return pending.get()
+        return self.entries[name].decode()
+    def prefetch(self, names):
+        '''
+        Starts decoding names in the background. Prefetches of other
+        names are dropped so that at most len(names) images are held.
+        '''
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(1)
+            for name in list(self.prefetched):
+                if name not in names:
+                    del self.prefetched[name]
+            for name in names:
+                if name not in self.prefetched:
+                    self.prefetched[name] = self.pool.apply_async(self.entries[name].decode)
+    def ready(self, name):
+        '''
+        False while a prefetch of name is still decoding
+        '''
+        with self.lock:
+            pending = self.prefetched.get(name)
+        return pending is None or pending.ready()
+    def neighbours(self, name, count=1):
+        '''
+        Entries next to name in the menu, the likeliest to be picked next
+        '''
+        names = self.names()
+        if name not in names:
+            return []
+        index = names.index(name)
+        return [names[i] for i in range(index - count, index + count + 1)
+                if i != index and 0 <= i < len(names)]
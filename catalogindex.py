@@ -0,0 +1,212 @@
+'''
+Index of the catalog images: dimensions, channels, dtype, pixscale,
+content hash and a small thumbnail of every file, so menus and memory
+estimates do not have to decode anything. To use:
+index = CatalogIndex(catalog)
+index.update() # only rescans files whose mtime or size changed
+index.record('Galaxy Image 1')['shape']
+index.thumbnail('Galaxy Image 1')
+The index is kept as one compressed .npz next to the ArrayCache files.
+'''
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy
+from arraycache import default_cache_dir
+from kernels import bin_resample, cast_like
+from resample import compact_image, display_limits
+
+
+# Thumbnails are at most THUMBNAIL_SIZE pixels a side
+THUMBNAIL_SIZE = 128
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    '''
+    uint8 copy of image averaged down to at most size pixels a side.
+    Images read on demand are first subsampled, so only part of them is read.
+    '''
+    shape = numpy.shape(image)
+    if not isinstance(image, numpy.ndarray):
+        step = max(int(numpy.ceil(max(shape[:2]) / (4. * size))), 1)
+        image = numpy.asarray(image[::step, ::step])
+        shape = image.shape
+    factor = max(int(numpy.ceil(max(shape[:2]) / float(size))), 1)
+    thumbnail = bin_resample(image, 1. / factor, conserve_flux=False) if factor > 1 else image
+    if image.dtype != numpy.uint8:
+        vmin, vmax = display_limits(thumbnail)
+        thumbnail = (numpy.asarray(thumbnail, dtype=numpy.float32) - vmin) * (255. / max(vmax - vmin, 1e-12))
+    return cast_like(thumbnail, numpy.uint8)
+
+
+def memory_estimate(record):
+    '''
+    Bytes an ImageObject of the record needs for its master, pyramid and
+    float32 spline coefficients
+    '''
+    pixels = numpy.prod(record['shape'][:2]) * record['compact_channels']
+    # Every pyramid level is a quarter of the one before, 4/3 in total
+    return int(4. / 3. * (record['compact_nbytes'] + pixels * 4))
+
+
+class CatalogIndex:
+    '''
+    Metadata and thumbnails of the entries of a Catalog, by name.
+    Scanning decodes the changed files on threads threads.
+    '''
+    def __init__(self, catalog, path=None, threads=4):
+        self.catalog = catalog
+        if path is None:
+            manifest_hash = hashlib.sha1(catalog.manifest.encode('utf-8')).hexdigest()[:12]
+            path = os.path.join(default_cache_dir(), 'catalog_index_%s.npz' % manifest_hash)
+        self.path = path
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.records = {}
+        self.thumbnails = {}
+        self.load()
+    def load(self):
+        try:
+            with numpy.load(self.path) as data:
+                records = json.loads(str(data['records']))
+                thumbnails = dict((key[len('thumbnail_'):], data[key]) for key in data.files
+                                  if key.startswith('thumbnail_'))
+        except (IOError, ValueError, KeyError):
+            return
+        with self.lock:
+            self.records = records
+            self.thumbnails = thumbnails
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self.lock:
+            arrays = dict(('thumbnail_' + key, thumbnail) for key, thumbnail in self.thumbnails.items())
+            arrays['records'] = numpy.array(json.dumps(self.records))
+        # Written to a temporary file first, other GUIs may be reading it
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory or '.')
+        with os.fdopen(fd, 'wb') as f:
+            numpy.savez_compressed(f, **arrays)
+        os.rename(tmp_path, self.path)
+    def is_current(self, entry):
+        '''
+        True if the record of entry matches the file on disk
+        '''
+        record = self.record(entry.name)
+        if record is None or record['path'] != entry.path:
+            return False
+        stat = os.stat(entry.path)
+        return record['mtime'] == stat.st_mtime and record['size'] == stat.st_size
+    def scan(self, entry):
+        '''
+        Decodes entry and returns its (record, thumbnail)
+        '''
+        stat = os.stat(entry.path)
+        if entry.array_cache is not None:
+            content_hash = entry.array_cache.content_hash(entry.path)
+        else:
+            content_hash = file_hash(entry.path)
+        image = entry.decode()
+        shape = list(numpy.shape(image))
+        compact = compact_image(image)
+        record = {'name': entry.name, 'path': entry.path, 'mtime': stat.st_mtime,
+                  'size': stat.st_size, 'hash': content_hash, 'pixscale': entry.pixscale,
+                  'shape': shape, 'dtype': str(image.dtype),
+                  'channels': shape[2] if len(shape) == 3 else 1,
+                  'compact_channels': compact.shape[2] if compact.ndim == 3 else 1,
+                  'nbytes': int(numpy.prod(shape)) * image.dtype.itemsize,
+                  'compact_nbytes': int(numpy.prod(numpy.shape(compact))) * compact.dtype.itemsize}
+        return record, make_thumbnail(compact)
+    def update(self):
+        '''
+        Rescans the entries that are new or changed on disk, in parallel,
+        drops the ones that are gone and saves the index if anything
+        changed. Returns the names that were scanned.
+        '''
+        entries = [self.catalog.entry(name) for name in self.catalog.names()]
+        stale = [entry for entry in entries if not self.is_current(entry)]
+        names = set(entry.name for entry in entries)
+        with self.lock:
+            removed = [name for name in self.records if name not in names]
+        if not stale and not removed:
+            return []
+        scanned = []
+        if stale:
+            pool = ThreadPool(min(self.threads, len(stale)))
+            try:
+                scanned = pool.map(self.scan, stale)
+            finally:
+                pool.close()
+        with self.lock:
+            for name in removed:
+                del self.records[name]
+            for record, thumbnail in scanned:
+                self.records[record['name']] = record
+                self.thumbnails[record['hash']] = thumbnail
+            # Thumbnails of files that changed or are gone
+            hashes = set(record['hash'] for record in self.records.values())
+            for key in list(self.thumbnails):
+                if key not in hashes:
+                    del self.thumbnails[key]
+        self.save()
+        return [entry.name for entry in stale]
+    def names(self):
+        '''
+        Indexed names, in catalog order
+        '''
+        with self.lock:
+            return [name for name in self.catalog.names() if name in self.records]
+    def record(self, name):
+        with self.lock:
+            return self.records.get(name)
+    def thumbnail(self, name):
+        with self.lock:
+            record = self.records.get(name)
+            if record is None:
+                return None
+            return self.thumbnails.get(record['hash'])
+    def describe(self, name):
+        '''
+        One line summary of name for menus, e.g.
+        '1024 x 768 x 3 uint8, 0.05 arcsecs/pix, ~8.4 MB in memory'
+        '''
+        record = self.record(name)
+        if record is None:
+            return name
+        text = ' x '.join(str(n) for n in record['shape']) + ' ' + record['dtype']
+        if record['pixscale'] is not None:
+            text += ', %g arcsecs/pix' % record['pixscale']
+        if record['compact_channels'] < record['channels']:
+            text += ', stored as 1 channel'
+        return text + ', ~%.1f MB in memory' % (memory_estimate(record) / 1024. ** 2)
+
+
+def main():
+    import argparse
+    from arraycache import ArrayCache
+    from catalog import Catalog
+    parser = argparse.ArgumentParser(description='Updates the index of a catalog')
+    parser.add_argument('--catalog', default='catalog.json', help='catalog manifest')
+    args = parser.parse_args()
+    index = CatalogIndex(Catalog(args.catalog, ArrayCache()))
+    scanned = index.update()
+    for name in index.names():
+        print('%s%-32s %s' % ('*' if name in scanned else ' ', name, index.describe(name)))
+    print('%d of %d images rescanned, index in %s' % (len(scanned), len(index.names()), index.path))
+
+
+if __name__ == "__main__":
+    main()
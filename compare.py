@@ -0,0 +1,266 @@
+from __future__ import print_function
+
+import sys
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt4agg import (
+    FigureCanvasQTAgg as FigureCanvas,
+    NavigationToolbar2QT as NavigationToolbar)
+from matplotlib.backends import qt4_compat
+import matplotlib.patches as patches
+use_pyside = qt4_compat.QT_API == qt4_compat.QT_API_PYSIDE
+import numpy
+from resample import ImageObject
+from catalog import Catalog
+from arraycache import ArrayCache
+from framecache import FrameCache, DEFAULT_CACHE_BYTES
+from worker import ResampleService
+from rendering import BlitManager, decimate_to_axes
+from matplotlib.widgets import Slider
+
+if use_pyside:
+    from PySide.QtCore import *
+    from PySide.QtGui import *
+else:
+    from PyQt4.QtCore import *
+    from PyQt4.QtGui import *
+
+
+class Panel:
+    '''
+    One catalog image of CompareForm and the axes it is shown in
+    '''
+    def __init__(self, axes, name, obj):
+        self.axes = axes
+        self.name = name
+        self.obj = obj
+        self.imshow = axes.imshow(obj.current_image, interpolation='nearest', extent=obj.current_extent)
+        axes.set_title(name)
+    def show_frame(self, frame, extent):
+        frame, extent = decimate_to_axes(frame, extent, self.axes)
+        self.imshow.set_data(frame)
+        self.imshow.set_extent(extent)
+        if self.obj.cmap is not None:
+            self.imshow.set_cmap(self.obj.cmap)
+            self.imshow.set_clim(self.obj.clim)
+
+
+class CompareForm(QMainWindow):
+    '''
+    2 to 6 catalog images side by side at the same sampling and field of
+    view, with shared axes. One ResampleService resamples every panel in a
+    single batch per slider move. To initialize:
+    app = QApplication(sys.argv)
+    form = CompareForm(['Galaxy Simulation 1', 'Galaxy Image 1'])
+    form.show()
+    app.exec_()
+    '''
+    # Idle time (ms) after slider or view changes before the full resample
+    REFINE_DELAY = 150
+    MAX_PANELS = 6
+
+    def __init__(self, names, parent=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        QMainWindow.__init__(self, parent)
+        if not 1 <= len(names) <= self.MAX_PANELS:
+            raise ValueError('Can compare 1 to %d images' % self.MAX_PANELS)
+        self.catalog = Catalog('catalog.json', ArrayCache())
+        # Panels showing the same image share its frames
+        self.frame_cache = FrameCache(cache_bytes)
+        self.service = ResampleService()
+        self.resample_timer = QTimer(self)
+        self.resample_timer.timeout.connect(self.poll_resample)
+        self.resample_timer.start(30)
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(self.refine)
+        self.resample_request = None
+        self.create_main_frame(names)
+        self.init_draw(names)
+    def create_main_frame(self, names):
+        self.main_frame = QWidget()
+        self.fig = Figure((14.0, 10.0), dpi=100)
+        self.canvas = FigureCanvas(self.fig)
+        self.canvas.setParent(self.main_frame)
+        self.mpl_toolbar = NavigationToolbar(self.canvas, self.main_frame)
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.canvas)
+        vbox.addWidget(self.mpl_toolbar)
+
+        # One image selection dropdown box per panel
+        menu_layout = QHBoxLayout()
+        self.image_selection_menus = []
+        available = self.catalog.names()
+        for index, name in enumerate(names):
+            menu = QComboBox()
+            for item in available:
+                menu.addItem(item)
+            menu.setCurrentIndex(available.index(name))
+            menu.activated[str].connect(lambda name, index=index: self.image_selection(index, name))
+            menu_layout.addWidget(menu)
+            self.image_selection_menus.append(menu)
+        vbox.addLayout(menu_layout)
+        self.main_frame.setLayout(vbox)
+        self.setCentralWidget(self.main_frame)
+    def load(self, name):
+        entry = self.catalog.entry(name)
+        im = self.catalog.load(name)
+        return ImageObject(im, entry.pixscale, key=name, cache=self.frame_cache)
+    def init_draw(self, names):
+        '''
+        Sets up a grid of panels with shared axes and the sliders
+        '''
+        self.fig.clear()
+        columns = int(numpy.ceil(numpy.sqrt(len(names))))
+        rows = int(numpy.ceil(len(names) / float(columns)))
+        self.fig.subplots_adjust(bottom = .25)
+        self.panels = []
+        first = None
+        for index, name in enumerate(names):
+            axes = self.fig.add_subplot(rows, columns, index + 1, sharex=first, sharey=first)
+            first = first or axes
+            axes.set_xlabel('Arcsecs')
+            self.panels.append(Panel(axes, name, self.load(name)))
+        # Frames may only cover the view, so their extent must not rescale the axes
+        first.set_autoscale_on(False)
+        xsize = max(panel.obj.xsize_arcsecs for panel in self.panels)
+        ysize = max(panel.obj.ysize_arcsecs for panel in self.panels)
+        first.set_xlim(-xsize / 2., xsize / 2.)
+        first.set_ylim(-ysize / 2., ysize / 2.)
+        # The axes are shared, so the first one reports every pan and zoom
+        first.callbacks.connect('xlim_changed', self.view_changed)
+        first.callbacks.connect('ylim_changed', self.view_changed)
+        for panel in self.panels:
+            panel.show_frame(panel.obj.current_image, panel.obj.current_extent)
+
+        pixscale = min(panel.obj.master_sampling for panel in self.panels)
+        self.requested_sampling = pixscale
+        self.sample_axis = self.fig.add_axes([0.25, 0.1, 0.65, 0.03])
+        self.fov_axis = self.fig.add_axes([0.25, 0.15, 0.65, 0.03])
+        self.sample_slider = Slider(self.sample_axis, 'Sampling (arcsecs/pix)', pixscale,
+                                    pixscale * 100., valinit = pixscale)
+        self.current_fov = 10.
+        self.current_center = (0., 0.)
+        self.fov_slider = Slider(self.fov_axis, 'Field of View (arsecs)', xsize / 100., xsize,
+                                 valinit = self.current_fov)
+        self.fov_squares = []
+        for panel in self.panels:
+            square = patches.Rectangle((0., 0.), 1., 1., fill = False, linewidth = 2.0, edgecolor = 'red')
+            panel.axes.add_artist(square)
+            self.fov_squares.append(square)
+        self.update_fov_squares()
+        self.blit = BlitManager(self.canvas, self.fov_squares)
+        def update(val):
+            if self.sample_slider.val != self.requested_sampling:
+                self.request_sampling(self.sample_slider.val)
+            self.current_fov = self.fov_slider.val
+            self.update_fov_squares()
+            self.blit.update()
+
+        def onclick(event):
+            if event.xdata is not None and event.ydata is not None:
+                if any(event.inaxes == panel.axes for panel in self.panels):
+                    self.current_center = (event.xdata, event.ydata)
+                    self.update_fov_squares()
+                    self.blit.update()
+        self.cid = self.fig.canvas.mpl_connect('button_press_event', onclick)
+        self.sample_slider.on_changed(update)
+        self.fov_slider.on_changed(update)
+        self.canvas.draw()
+
+    def update_fov_squares(self):
+        '''
+        Moves the field of view square of every panel to current_center
+        and current_fov
+        '''
+        x = self.current_center[0] - self.current_fov / 2.
+        y = self.current_center[1] - self.current_fov / 2.
+        for square in self.fov_squares:
+            square.set_xy((x, y))
+            square.set_width(self.current_fov)
+            square.set_height(self.current_fov)
+
+    def view_region(self):
+        '''
+        Visible axes limits, padded by a quarter of the view on each side
+        so that small pans are already covered
+        '''
+        x0, x1 = sorted(self.panels[0].axes.get_xlim())
+        y0, y1 = sorted(self.panels[0].axes.get_ylim())
+        xpad = (x1 - x0) / 4.
+        ypad = (y1 - y0) / 4.
+        return (x0 - xpad, x1 + xpad), (y0 - ypad, y1 + ypad)
+
+    def view_changed(self, axes):
+        self.request_sampling(self.requested_sampling)
+
+    def request_sampling(self, sampling):
+        '''
+        Shows quick previews of every panel at sampling, then schedules
+        the full resample
+        '''
+        self.requested_sampling = sampling
+        xlim, ylim = self.view_region()
+        for panel in self.panels:
+            frame, extent = panel.obj.resampled_region(sampling, xlim, ylim, preview=True)
+            panel.show_frame(frame, extent)
+        self.canvas.draw_idle()
+        self.refine_timer.start(self.REFINE_DELAY)
+
+    def refine(self):
+        '''
+        Called by refine_timer once input is idle, resamples every panel
+        in one batch
+        '''
+        sampling = self.requested_sampling
+        xlim, ylim = self.view_region()
+        batch = {}
+        for index, panel in enumerate(self.panels):
+            key = (panel.obj.key, sampling, xlim, ylim)
+            batch[index] = (key, panel.obj.resampled_region, (sampling, xlim, ylim))
+        self.resample_request = ([panel.obj for panel in self.panels], sampling, xlim, ylim)
+        self.service.submit(batch)
+
+    def poll_resample(self):
+        '''
+        Called by resample_timer, shows the latest finished batch
+        '''
+        results = self.service.poll()
+        if results is None:
+            return
+        objs, sampling, xlim, ylim = self.resample_request
+        if (objs != [panel.obj for panel in self.panels] or sampling != self.requested_sampling or
+                (xlim, ylim) != self.view_region()):
+            return
+        for index, (frame, error) in results.items():
+            if error is not None:
+                print('Resampling failed:', error)
+                continue
+            frame, extent = frame
+            panel = self.panels[index]
+            panel.obj.current_image = frame
+            panel.obj.current_extent = extent
+            panel.obj.current_sampling = sampling
+            panel.show_frame(frame, extent)
+        self.canvas.draw()
+
+    def image_selection(self, index, image_name):
+        '''
+        Replaces the image of panel index and resamples it like the others
+        '''
+        image_name = str(image_name)
+        panel = self.panels[index]
+        panel.name = image_name
+        panel.obj = self.load(image_name)
+        panel.axes.set_title(image_name)
+        self.request_sampling(self.requested_sampling)
+
+
+def main():
+    app = QApplication(sys.argv)
+    names = sys.argv[1:] or Catalog('catalog.json').names()[:2]
+    form = CompareForm(names)
+    form.show()
+    app.exec_()
+
+if __name__ == "__main__":
+    main()
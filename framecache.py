@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+# Default memory budget for resampled frames
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2
+
+
+class FrameCache:
+    '''
+    Memory bounded LRU cache of resampled frames, keyed by image identity
+    and quantized sampling. Shared between ImageObjects:
+    cache = FrameCache(max_bytes = 128 * 1024 ** 2)
+    obj = ImageObject(im, pixscale, key = 'Galaxy Image 1', cache = cache)
+    '''
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, quantum=1e-4):
+        self.max_bytes = max_bytes
+        # Samplings closer than quantum (arcsecs/pix) share a frame
+        self.quantum = quantum
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Frames are computed on the resampling worker thread
+        self.lock = threading.Lock()
+    def make_key(self, image_key, sampling):
+        return (image_key, int(round(sampling / self.quantum)))
+    def get(self, image_key, sampling, count=True):
+        '''
+        Returns the cached frame, or None on a miss. Lookups that are not
+        requests for a frame, such as previews, pass count=False to stay
+        out of the hit and miss counts.
+        '''
+        found, frame = self.get_any([image_key], sampling, count)
+        return frame
+    def get_any(self, image_keys, sampling, count=True):
+        '''
+        Returns (index, frame) of the first of image_keys that is cached,
+        or (None, None), counted as one hit or miss
+        '''
+        with self.lock:
+            for index, image_key in enumerate(image_keys):
+                key = self.make_key(image_key, sampling)
+                frame = self.frames.pop(key, None)
+                if frame is not None:
+                    # Re-insert as most recently used
+                    self.frames[key] = frame
+                    if count:
+                        self.hits += 1
+                    return index, frame
+            if count:
+                self.misses += 1
+            return None, None
+    def put(self, image_key, sampling, frame):
+        key = self.make_key(image_key, sampling)
+        # Frames are shared by every ImageObject asking for them
+        frame.flags.writeable = False
+        with self.lock:
+            if key in self.frames:
+                self.nbytes -= self.frames.pop(key).nbytes
+            if frame.nbytes > self.max_bytes:
+                return
+            self.frames[key] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                old_key, old_frame = self.frames.popitem(last=False)
+                self.nbytes -= old_frame.nbytes
+                self.evictions += 1
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.nbytes = 0
+    def stats(self):
+        return {'frames': len(self.frames), 'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
@@ -1,21 +1,28 @@
 from __future__ import print_function
 
 import sys
+import threading
+import time
+# Start of the imports, for --startup-time
+_start_time = time.time()
 
 from matplotlib.figure import Figure
-from matplotlib.backend_bases import key_press_handler
 from matplotlib.backends.backend_qt4agg import (
     FigureCanvasQTAgg as FigureCanvas,
     NavigationToolbar2QT as NavigationToolbar)
 from matplotlib.backends import qt4_compat
-from matplotlib import animation
 import matplotlib.patches as patches
 use_pyside = qt4_compat.QT_API == qt4_compat.QT_API_PYSIDE
 import numpy
-from scipy import misc
 from resample import ImageObject
-from matplotlib.widgets import Slider, Button, RadioButtons
-from matplotlib import gridspec
+from catalog import Catalog
+from catalogindex import CatalogIndex
+from arraycache import ArrayCache
+from framecache import FrameCache, DEFAULT_CACHE_BYTES
+from worker import ResampleWorker
+from rendering import BlitManager, decimate_to_axes
+from timing import timer
+from matplotlib.widgets import Slider
 
 if use_pyside:
     from PySide.QtCore import *
@@ -33,12 +40,48 @@ class AppForm(QMainWindow):
     form.show()
     app.exec_()
     '''
-    def __init__(self, parent=None):
+    # Idle time (ms) after slider or view changes before the full resample
+    REFINE_DELAY = 150
+
+    def __init__(self, parent=None, cache_bytes=DEFAULT_CACHE_BYTES, report_startup=False):
         QMainWindow.__init__(self, parent)
+        # Images offered in image_selection_menu, decoded on demand.
+        # Decoded arrays are kept in the on-disk cache shared by all GUIs.
+        self.catalog = Catalog('catalog.json', ArrayCache())
+        # Shapes, thumbnails and memory estimates of the catalog images. The
+        # saved index is used at once, changed files are rescanned in the
+        # background once the first image is up, so the scan does not slow
+        # startup, and poll_index refreshes the menu when that is done.
+        self.index = CatalogIndex(self.catalog)
+        self.index_thread = threading.Thread(target=self.index.update)
+        self.index_thread.daemon = True
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self.poll_index)
+        # Resampled frames of every image viewed this session
+        self.frame_cache = FrameCache(cache_bytes)
+        # Resampling runs on the worker, poll_resample displays the results
+        self.worker = ResampleWorker()
+        self.worker.start()
+        self.resample_timer = QTimer(self)
+        self.resample_timer.timeout.connect(self.poll_resample)
+        self.resample_timer.start(30)
+        # While sliders move, previews are shown and the full resample waits
+        # until they have been still for REFINE_DELAY ms
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(self.refine)
+        # Print how long the first image took to appear
+        self.report_startup = report_startup
         # Creates GUI framework
         self.create_main_frame()
-        # Plots initial image
-        self.init_draw()
+        # The window shows a placeholder while the initial image decodes in
+        # the background, poll_initial_image then plots it
+        self.initial_image_name = 'Galaxy Image 1'
+        self.show_placeholder()
+        self.catalog.prefetch([self.initial_image_name])
+        self.initial_timer = QTimer(self)
+        self.initial_timer.timeout.connect(self.poll_initial_image)
+        self.initial_timer.start(30)
     def create_main_frame(self):
         self.main_frame = QWidget()
 
@@ -58,24 +101,106 @@ class AppForm(QMainWindow):
         vbox.addWidget(self.canvas)  # the matplotlib canvas
         vbox.addWidget(self.mpl_toolbar)
 
-        # Image selection dropdown box
+        # Image selection dropdown box, with the thumbnail and size of the
+        # highlighted image
         self.image_selection_menu = QComboBox()
-        self.image_selection_menu.addItem('Galaxy Simulation 1')
-#        self.image_selection_menu.addItem('Galaxy Image 1')
-#        self.image_selection_menu.addItem('Galaxy Image 2')
-        self.image_selection_menu.addItem('Jupiter Narrow Field Simulation')
-        self.image_selection_menu.addItem('Jupiter Wide Field Simulation')
-        self.image_selection_menu.addItem('Star Formation Simulation 1')
-        self.image_selection_menu.addItem('Star Formation Simulation 2')
-        self.image_selection_menu.addItem('Star Formation Simulation 3')
-#        self.image_selection_menu.addItem('Star Formation Image 1')
-#        self.image_selection_menu.addItem('Star Formation Image 2')
+        self.fill_image_menu()
         self.image_selection_menu.activated[str].connect(self.image_selection)
-        vbox.addWidget(self.image_selection_menu)
+        self.image_selection_menu.highlighted[str].connect(self.show_image_info)
+        # Enabled once the initial image is drawn
+        self.image_selection_menu.setEnabled(False)
+        self.thumbnail_label = QLabel()
+        self.image_info_label = QLabel()
+        menu_layout = QHBoxLayout()
+        menu_layout.addWidget(self.image_selection_menu)
+        menu_layout.addWidget(self.thumbnail_label)
+        menu_layout.addWidget(self.image_info_label)
+        vbox.addLayout(menu_layout)
+
+        # Timings of the hot paths, only collected while shown
+        self.timing_checkbox = QCheckBox('Show timings')
+        self.timing_checkbox.setChecked(timer.enabled)
+        self.timing_checkbox.toggled.connect(self.show_timings)
+        self.trace_button = QPushButton('Export trace')
+        self.trace_button.clicked.connect(self.export_trace)
+        timing_layout = QHBoxLayout()
+        timing_layout.addWidget(self.timing_checkbox)
+        timing_layout.addWidget(self.trace_button)
+        vbox.addLayout(timing_layout)
+        self.timing_label = QLabel()
+        self.timing_label.setFont(QFont('Monospace'))
+        vbox.addWidget(self.timing_label)
+        self.timing_timer = QTimer(self)
+        self.timing_timer.timeout.connect(self.refresh_timings)
+        self.show_timings(timer.enabled)
 
         # Initialize GUI
         self.main_frame.setLayout(vbox)
         self.setCentralWidget(self.main_frame)
+    def fill_image_menu(self):
+        '''
+        Lists the indexed images, or the whole catalog before the first
+        index scan, keeping the current selection
+        '''
+        current = str(self.image_selection_menu.currentText())
+        names = self.index.names() or self.catalog.names()
+        self.image_selection_menu.clear()
+        for position, name in enumerate(names):
+            self.image_selection_menu.addItem(name)
+            self.image_selection_menu.setItemData(position, self.index.describe(name), Qt.ToolTipRole)
+        if current in names:
+            self.image_selection_menu.setCurrentIndex(names.index(current))
+
+    def poll_index(self):
+        '''
+        Called by index_timer until the background index update is done
+        '''
+        if self.index_thread.is_alive():
+            return
+        self.index_timer.stop()
+        self.fill_image_menu()
+        self.show_image_info(self.image_selection_menu.currentText())
+
+    def show_image_info(self, image_name):
+        '''
+        Shows the thumbnail and size of image_name from the index
+        '''
+        image_name = str(image_name)
+        self.image_info_label.setText(self.index.describe(image_name))
+        thumbnail = self.index.thumbnail(image_name)
+        if thumbnail is None:
+            self.thumbnail_label.clear()
+            return
+        if thumbnail.ndim == 2:
+            thumbnail = numpy.dstack([thumbnail] * 3)
+        thumbnail = numpy.ascontiguousarray(thumbnail[:, :, :3])
+        height, width = thumbnail.shape[:2]
+        # QImage does not copy the bytes, so they are kept until fromImage
+        # has copied them
+        data = thumbnail.tobytes()
+        image = QImage(data, width, height, 3 * width, QImage.Format_RGB888)
+        self.thumbnail_label.setPixmap(QPixmap.fromImage(image))
+
+    def show_placeholder(self):
+        self.fig.clear()
+        self.fig.text(.5, .5, 'Loading %s...' % self.initial_image_name,
+                      horizontalalignment='center', verticalalignment='center')
+        self.canvas.draw()
+
+    def poll_initial_image(self):
+        '''
+        Called by initial_timer until the initial image is decoded
+        '''
+        if not self.catalog.ready(self.initial_image_name):
+            return
+        self.initial_timer.stop()
+        self.init_draw()
+        self.image_selection_menu.setEnabled(True)
+        self.index_thread.start()
+        self.index_timer.start(500)
+        if self.report_startup:
+            print('First image drawn after %.2f s' % (time.time() - _start_time))
+
     def init_draw(self):
         '''
         Sets up all of the matplotlib widgets
@@ -84,16 +209,23 @@ class AppForm(QMainWindow):
         self.image_axes = self.fig.add_subplot(111)
         self.fig.subplots_adjust(bottom = .25)
         # Initial image 
-        # FIXME add null image
-        self.current_pixscale = .05
-        im = misc.imread('galaxy_images/im1.jpg')
-        self.obj = ImageObject(im, self.current_pixscale)
+        entry = self.catalog.entry(self.initial_image_name)
+        self.current_pixscale = entry.pixscale
+        im = self.catalog.load(entry.name)
+        self.obj = ImageObject(im, self.current_pixscale, key=entry.name, cache=self.frame_cache)
         self.image_object = self.obj.current_image
+        self.requested_sampling = self.obj.current_sampling
         
         # Initialize slider bars
         self.imshow = self.image_axes.imshow(self.image_object, interpolation='nearest', 
                                              extent = [-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2.,
                                                        -self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.])
+        # Frames may only cover the view, so their extent must not rescale the axes
+        self.image_axes.set_autoscale_on(False)
+        self.image_axes.callbacks.connect('xlim_changed', self.view_changed)
+        self.image_axes.callbacks.connect('ylim_changed', self.view_changed)
+        self.show_frame(self.obj.current_image, self.obj.current_extent)
+        self.canvas.mpl_connect('resize_event', self.canvas_resized)
         self.sample_axis = self.fig.add_axes([0.25, 0.1, 0.65, 0.03])
         self.fov_axis = self.fig.add_axes([0.25, 0.15, 0.65, 0.03])
         self.sample_slider = Slider(self.sample_axis, 'Sampling (arcsecs/pix)', self.current_pixscale, 
@@ -105,14 +237,15 @@ class AppForm(QMainWindow):
         rectsize = 10.
         self.fov_square = patches.Rectangle((-self.current_fov / 2., - self.current_fov / 2.), rectsize, rectsize, fill = False, linewidth = 4.0, edgecolor = 'red')
         self.image_axes.add_artist(self.fov_square)
+        # Moving or resizing the square only redraws the square
+        self.blit = BlitManager(self.canvas, [self.fov_square])
         def update(val):
-            if self.sample_slider.val != self.obj.current_sampling:
-                self.obj.update_sampling(self.sample_slider.val)
-                self.imshow.set_data(self.obj.current_image)
+            if self.sample_slider.val != self.requested_sampling:
+                self.request_sampling(self.sample_slider.val)
             fov = self.fov_slider.val 
             self.update_fov_square_size(fov)
             self.current_fov = fov
-            self.canvas.draw()
+            self.blit.update()
 
         def onclick(event):
             if event.xdata is not None and event.ydata is not None:
@@ -121,7 +254,7 @@ class AppForm(QMainWindow):
                     self.update_fov_square_loc(loc)
                     self.current_xloc = loc[0]
                     self.current_yloc = loc[1]
-                    self.canvas.draw()
+                    self.blit.update()
         self.cid = self.fig.canvas.mpl_connect('button_press_event', onclick)
         self.sample_slider.on_changed(update)
         self.fov_slider.on_changed(update)
@@ -145,93 +278,162 @@ class AppForm(QMainWindow):
         self.current_yloc = new_yloc
         self.fov_square.set_xy((new_xloc, new_yloc))
 
-    def image_selection(self, image_name):
-        ''' 
-        Hacked together image selection. 
-        Takes selection from the image_selection_menu widget 
-        '''
-        if image_name == 'Galaxy Image 1':
-            im = misc.imread('galaxy_images/im1.jpg')
-            pixscale = .05
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Image 2':
-            im = misc.imread('galaxy_images/im2.jpg')
-            pixscale = .05
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Simulation 1':
-            im = misc.imread('galaxy_simulations/im1.jpg')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Jupiter Narrow Field Simulation':
-            im = misc.imread('jupiter_simulation/jupiter_zoomin.png')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Jupiter Wide Field Simulation':
-            im = misc.imread('jupiter_simulation/jupiter_zoomout.png')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 1':
-            im = misc.imread('star_formation_simulation/im1.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 2':
-            im = misc.imread('star_formation_simulation/im2.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 3':
-            im = misc.imread('star_formation_simulation/im3.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 1':
-            im = misc.imread('star_formation_images/im1.jpg')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 2':
-            im = misc.imread('star_formation_images/im2.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
+    def request_sampling(self, sampling):
+        '''
+        Shows a quick preview of the visible part of the current image at
+        sampling, then schedules the full resample
+        '''
+        self.requested_sampling = sampling
+        xlim, ylim = self.view_region()
+        with timer.span('preview'):
+            frame, extent = self.obj.resampled_region(sampling, xlim, ylim, preview=True)
+        self.show_frame(frame, extent)
+        self.canvas.draw_idle()
+        self.refine_timer.start(self.REFINE_DELAY)
+
+    def refine(self):
+        '''
+        Called by refine_timer once input is idle, hands the full resample
+        to the worker thread. poll_resample displays the frame once it is ready.
+        '''
+        sampling = self.requested_sampling
+        xlim, ylim = self.view_region()
+        self.resample_request = (self.obj, sampling, xlim, ylim)
+        self.worker.submit(self.obj.resampled_region, sampling, xlim, ylim)
+
+    def view_region(self):
+        '''
+        Visible axes limits, padded by a quarter of the view on each side
+        so that small pans are already covered
+        '''
+        x0, x1 = sorted(self.image_axes.get_xlim())
+        y0, y1 = sorted(self.image_axes.get_ylim())
+        xpad = (x1 - x0) / 4.
+        ypad = (y1 - y0) / 4.
+        return (x0 - xpad, x1 + xpad), (y0 - ypad, y1 + ypad)
+
+    def view_changed(self, axes):
+        '''
+        Toolbar zoom or pan, resamples the newly visible region
+        '''
+        self.request_sampling(self.requested_sampling)
 
+    def poll_resample(self):
+        '''
+        Called by resample_timer, shows the latest finished frame
+        '''
+        result = self.worker.poll()
+        if result is None:
+            return
+        frame, error = result
+        if error is not None:
+            print('Resampling failed:', error)
+            return
+        frame, extent = frame
+        obj, sampling, xlim, ylim = self.resample_request
+        # Only if nothing was asked for since the refine started
+        if (obj is self.obj and sampling == self.requested_sampling and
+                (xlim, ylim) == self.view_region()):
+            obj.current_image = frame
+            obj.current_extent = extent
+            obj.current_sampling = sampling
+            self.show_frame(frame, extent)
+            with timer.span('canvas_draw'):
+                self.canvas.draw()
+
+    def show_frame(self, frame, extent):
+        '''
+        Displays frame decimated to the screen resolution of image_axes.
+        The full resolution frame stays in self.obj.current_image.
+        '''
+        with timer.span('set_data'):
+            frame, extent = decimate_to_axes(frame, extent, self.image_axes)
+            self.imshow.set_data(frame)
+            self.imshow.set_extent(extent)
+            if self.obj.cmap is not None:
+                # Single channel data is colormapped here
+                self.imshow.set_cmap(self.obj.cmap)
+                self.imshow.set_clim(self.obj.clim)
 
+    def canvas_resized(self, event):
+        if hasattr(self, 'obj'):
+            self.show_frame(self.obj.current_image, self.obj.current_extent)
+
+    def show_timings(self, shown):
+        timer.enabled = shown
+        self.timing_label.setVisible(shown)
+        self.trace_button.setEnabled(shown)
+        if shown:
+            self.refresh_timings()
+            self.timing_timer.start(1000)
+        else:
+            self.timing_timer.stop()
+
+    def refresh_timings(self):
+        self.timing_label.setText(timer.format_stats())
+
+    def export_trace(self):
+        path = QFileDialog.getSaveFileName(self, 'Export trace', 'trace.json', 'Trace (*.json)')
+        if isinstance(path, tuple):
+            # PySide returns (path, filter)
+            path = path[0]
+        if path:
+            timer.export_trace(str(path))
+
+    def image_selection(self, image_name):
+        '''
+        Takes selection from the image_selection_menu widget and loads it
+        from the catalog, then starts decoding its menu neighbours
+        '''
+        image_name = str(image_name)
+        entry = self.catalog.entry(image_name)
+        im = self.catalog.load(image_name)
+        self.obj = ImageObject(im, entry.pixscale, key=image_name, cache=self.frame_cache)
+        self.catalog.prefetch(self.catalog.neighbours(image_name))
+        self.show_image_info(image_name)
+        self.image_update()
 
     def image_update(self):
         '''
         Helper function to image selection, resets image and sliders
         '''
+        self.worker.cancel()
+        self.refine_timer.stop()
+        self.requested_sampling = self.obj.current_sampling
 
-        self.imshow.set_data(self.obj.current_image)
-        self.imshow.set_extent([-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2., 
-                                -self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.])
-        self.canvas.draw()
+        self.image_axes.set_xlim(-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2.)
+        self.image_axes.set_ylim(-self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.)
+        self.show_frame(self.obj.current_image, self.obj.current_extent)
+        with timer.span('canvas_draw'):
+            self.canvas.draw()
         if self.obj.master_sampling != self.current_pixscale:
             self.current_pixscale = self.obj.master_sampling
             self.sample_axis.cla()
             self.sample_slider = Slider(self.sample_axis, 'Sampling (arcsecs/pix)', self.current_pixscale, self.current_pixscale * 20., valinit = self.current_pixscale)
             def update(val):
-                self.obj.update_sampling(self.sample_slider.val)
-                self.imshow.set_data(self.obj.current_image)
-                self.canvas.draw()
+                if self.sample_slider.val != self.requested_sampling:
+                    self.request_sampling(self.sample_slider.val)
+                fov = self.fov_slider.val
+                self.update_fov_square_size(fov)
+                self.current_fov = fov
+                self.blit.update()
             self.sample_slider.on_changed(update)
         else:
             self.sample_slider.reset()
 
 
 def main():
+    # --startup-time prints how long imports, the window and the first
+    # image take from the start of the imports
+    report_startup = '--startup-time' in sys.argv
+    if report_startup:
+        sys.argv.remove('--startup-time')
+        print('Imports done after %.2f s' % (time.time() - _start_time))
     app = QApplication(sys.argv)
-    form = AppForm()
+    form = AppForm(report_startup=report_startup)
     form.show()
+    if report_startup:
+        print('Window shown after %.2f s' % (time.time() - _start_time))
     app.exec_()
 
 if __name__ == "__main__":
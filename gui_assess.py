@@ -3,7 +3,6 @@ from __future__ import print_function
 import sys
 
 from matplotlib.figure import Figure
-from matplotlib.backend_bases import key_press_handler
 from matplotlib.backends.backend_qt4agg import (
     FigureCanvasQTAgg as FigureCanvas,
     NavigationToolbar2QT as NavigationToolbar)
@@ -13,10 +12,9 @@ import matplotlib
 matplotlib.use('GTKAgg')
 
 import numpy
-from scipy import misc
 from resample import ImageObject
-from matplotlib.widgets import Slider, Button, RadioButtons
-from matplotlib import gridspec
+from catalog import Catalog
+from arraycache import ArrayCache
 
 if use_pyside:
     from PySide.QtCore import *
@@ -36,6 +34,9 @@ class AppForm(QMainWindow):
     '''
     def __init__(self, parent=None):
         QMainWindow.__init__(self, parent)
+        # Images offered in image_selection_menu, decoded on demand.
+        # Decoded arrays are kept in the on-disk cache shared by all GUIs.
+        self.catalog = Catalog('catalog.json', ArrayCache())
         # Creates GUI framework
         self.create_main_frame()
         # Plots initial image
@@ -68,16 +69,8 @@ class AppForm(QMainWindow):
 
         # Image selection dropdown box
         self.image_selection_menu = QComboBox()
-        self.image_selection_menu.addItem('Galaxy Simulation 1')
-        self.image_selection_menu.addItem('Galaxy Image 1')
-        self.image_selection_menu.addItem('Galaxy Image 2')
-        self.image_selection_menu.addItem('Jupiter Narrow Field Simulation')
-        self.image_selection_menu.addItem('Jupiter Wide Field Simulation')
-        self.image_selection_menu.addItem('Star Formation Simulation 1')
-        self.image_selection_menu.addItem('Star Formation Simulation 2')
-        self.image_selection_menu.addItem('Star Formation Simulation 3')
-        self.image_selection_menu.addItem('Star Formation Image 1')
-        self.image_selection_menu.addItem('Star Formation Image 2')
+        for name in self.catalog.names():
+            self.image_selection_menu.addItem(name)
         self.image_selection_menu.activated[str].connect(self.image_selection)
         vbox.addWidget(self.image_selection_menu)
 
@@ -108,7 +101,7 @@ class AppForm(QMainWindow):
                 self.obj.update_sampling(pixscale)
                 self.image_axes.set_xlim(-fov, fov)
                 self.image_axes.set_ylim(-fov, fov)
-                self.imshow.set_data(self.obj.current_image)
+                self.show_current()
                 self.canvas.draw()
             except:
                 QMessageBox.about(self, 'Error','Image size and object size must be numbers')
@@ -127,8 +120,9 @@ class AppForm(QMainWindow):
         self.image_axes = self.fig.add_subplot(111)
         # Initial image 
         # FIXME add null image
-        self.current_pixscale = .05
-        im = misc.imread('galaxy_images/im1.jpg')
+        entry = self.catalog.entry('Galaxy Image 1')
+        self.current_pixscale = entry.pixscale
+        im = self.catalog.load(entry.name)
         self.obj = ImageObject(im, self.current_pixscale)
         self.image_object = self.obj.current_image
         
@@ -136,6 +130,7 @@ class AppForm(QMainWindow):
         self.imshow = self.image_axes.imshow(self.image_object, interpolation='nearest', 
                                              extent = [-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2.,
                                                        -self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.])
+        self.show_current()
 
 
         
@@ -146,77 +141,37 @@ class AppForm(QMainWindow):
             fov = self.fov_slider.val 
             self.image_axes.set_xlim(-fov, fov)
             self.image_axes.set_ylim(-fov, fov)
-            self.imshow.set_data(self.obj.current_image)
+            self.show_current()
             self.canvas.draw()
         '''
 
 
-    def image_selection(self, image_name):
-        ''' 
-        Hacked together image selection. 
-        Takes selection from the image_selection_menu widget 
+    def show_current(self):
         '''
-        if image_name == 'Galaxy Image 1':
-            im = misc.imread('galaxy_images/im1.jpg')
-            pixscale = .05
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Image 2':
-            im = misc.imread('galaxy_images/im2.jpg')
-            pixscale = .05
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Simulation 1':
-            im = misc.imread('galaxy_simulations/im1.jpg')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Jupiter Narrow Field Simulation':
-            im = misc.imread('jupiter_simulation/jupiter_zoomin.png')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Jupiter Wide Field Simulation':
-            im = misc.imread('jupiter_simulation/jupiter_zoomout.png')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 1':
-            im = misc.imread('star_formation_simulation/im1.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 2':
-            im = misc.imread('star_formation_simulation/im2.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 3':
-            im = misc.imread('star_formation_simulation/im3.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 1':
-            im = misc.imread('star_formation_images/im1.jpg')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 2':
-            im = misc.imread('star_formation_images/im2.gif')
-            pixscale = .1
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
+        Displays the current image of obj, colormapping single channel data
+        '''
+        self.imshow.set_data(self.obj.current_image)
+        if self.obj.cmap is not None:
+            self.imshow.set_cmap(self.obj.cmap)
+            self.imshow.set_clim(self.obj.clim)
 
+    def image_selection(self, image_name):
+        '''
+        Takes selection from the image_selection_menu widget and loads it
+        from the catalog, then starts decoding its menu neighbours
+        '''
+        image_name = str(image_name)
+        entry = self.catalog.entry(image_name)
+        im = self.catalog.load(image_name)
+        self.obj = ImageObject(im, entry.pixscale)
+        self.catalog.prefetch(self.catalog.neighbours(image_name))
+        self.image_update()
 
     def image_update(self):
         '''
         Helper function to image selection, resets image and sliders
         '''
-        self.imshow.set_data(self.obj.current_image)
+        self.show_current()
         
 
 #        self.imshow.set_extent([-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2., 
@@ -0,0 +1,397 @@
+'''
+Registry of the ways ImageObject can resample a window of an image:
+scipy splines of every order, flux binning, Pillow resize filters and,
+if it is installed, OpenCV. Every backend puts output pixel i on input
+pixel i * (n_in - 1) / (n_out - 1), like scipy's zoom, so they are
+interchangeable. To use:
+ImageObject(image, .05, backend='pillow-bicubic')
+ImageObject(image, .05, backend='high') # fastest backend of the tier
+The fastest backend of an accuracy tier is found by calibrate(), which
+times every available backend on this machine and measures its error. The
+results are kept in the cache directory, so this is done once per machine:
+python backends.py --recalibrate
+'''
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+import numpy
+import scipy
+from arraycache import default_cache_dir
+from kernels import bin_window, cast_like, resampled_shape, spline_coefficients, zoom_tiled
+from timing import clock
+
+
+# Largest error, relative to the image range, of each accuracy tier.
+# The error is measured against a quintic spline on a smooth image.
+ACCURACY_TIERS = OrderedDict([('exact', 1e-4), ('high', 1e-3), ('fast', 1e-2), ('preview', 1.)])
+CALIBRATION_FILE = 'backends.json'
+
+
+class Backend:
+    '''
+    A way of resampling windows of an image. method is the ImageObject
+    method whose frame shapes the backend follows.
+    '''
+    name = None
+    method = 'spline'
+    def available(self):
+        return True
+    def prepare(self, image, threads=1):
+        '''
+        Per pyramid level data ImageObject keeps and passes back to
+        window as prepared, or None
+        '''
+        return None
+    def window(self, image, zoom_factor, rows, cols, dtype, threads=1, prepared=None, halo=8):
+        '''
+        Returns rows[0]:rows[1], cols[0]:cols[1] of image resampled by
+        zoom_factor, as dtype
+        '''
+        raise NotImplementedError
+
+
+class SplineBackend(Backend):
+    '''
+    scipy.ndimage spline of order 0 to 5. Orders above 1 keep the spline
+    coefficients of each level, see zoom_window.
+    '''
+    def __init__(self, order=3):
+        self.order = order
+        self.name = 'spline%d' % order
+    def prepare(self, image, threads=1):
+        if self.order < 2:
+            return None
+        return spline_coefficients(image, self.order, threads)
+    def window(self, image, zoom_factor, rows, cols, dtype, threads=1, prepared=None, halo=8):
+        if prepared is None:
+            return zoom_tiled(image, zoom_factor, rows, cols, threads, halo=halo, order=self.order,
+                              output=dtype)
+        return zoom_tiled(prepared, zoom_factor, rows, cols, threads, order=self.order,
+                          prefiltered=True, output=dtype)
+
+
+class BinBackend(Backend):
+    '''
+    Integrates the image over the output pixels, see bin_resample
+    '''
+    name = 'bin'
+    method = 'bin'
+    def window(self, image, zoom_factor, rows, cols, dtype, threads=1, prepared=None, halo=8):
+        frame = bin_window(image, zoom_factor, rows, cols)
+        return cast_like(frame * numpy.float32(zoom_factor ** 2), dtype)
+
+
+def padded_crop(image, zoom_factor, rows, cols, support):
+    '''
+    Returns (crop, scales, offsets) for resampling rows, cols of image with
+    a kernel reaching support input pixels: the input under the window as
+    float32, mirrored past the image edges like zoom_window, the input pixels
+    per output pixel and the crop position of the first output pixel.
+    '''
+    shape = numpy.shape(image)
+    out_shape = resampled_shape(shape, zoom_factor)
+    slices = []
+    pads = []
+    scales = []
+    offsets = []
+    for axis, (first, last) in enumerate((rows, cols)):
+        if out_shape[axis] > 1:
+            scale = (shape[axis] - 1.) / (out_shape[axis] - 1.)
+        else:
+            scale = 0.
+        lo = int(numpy.floor(first * scale - support))
+        hi = int(numpy.ceil((last - 1) * scale + support)) + 1
+        slices.append(slice(max(lo, 0), min(hi, shape[axis])))
+        pads.append((max(-lo, 0), max(hi - shape[axis], 0)))
+        scales.append(scale)
+        offsets.append(first * scale - lo)
+    crop = numpy.asarray(image[tuple(slices)], dtype=numpy.float32)
+    if any(any(pad) for pad in pads):
+        mode = 'reflect' if min(crop.shape[:2]) > 1 else 'edge'
+        crop = numpy.pad(crop, pads + [(0, 0)] * (crop.ndim - 2), mode=mode)
+    return crop, scales, offsets
+
+
+class PillowBackend(Backend):
+    '''
+    Pillow's resize with one of its filters, on float32 ('F' mode)
+    channels. Its filters widen when downsampling, so they antialias.
+    '''
+    # Kernel radius of each filter in input pixels, when upsampling
+    SUPPORT = {'nearest': .5, 'box': .5, 'bilinear': 1., 'hamming': 1., 'bicubic': 2., 'lanczos': 3.}
+    def __init__(self, filter_name):
+        self.filter_name = filter_name
+        self.name = 'pillow-' + filter_name
+    def available(self):
+        try:
+            from PIL import Image
+        except ImportError:
+            return False
+        # resize only takes a box from Pillow 4.3
+        return 'box' in Image.Image.resize.__code__.co_varnames
+    def window(self, image, zoom_factor, rows, cols, dtype, threads=1, prepared=None, halo=8):
+        from PIL import Image
+        filters = getattr(Image, 'Resampling', Image)
+        resample = getattr(filters, self.filter_name.upper())
+        support = self.SUPPORT[self.filter_name] * max(1. / zoom_factor, 1.) + 2
+        crop, scales, offsets = padded_crop(image, zoom_factor, rows, cols, support)
+        scales = [scale or 1. for scale in scales]
+        window = (rows[1] - rows[0], cols[1] - cols[0])
+        # Pillow samples pixel centres, so output pixel i, which zoom puts
+        # on input pixel offset + i * scale, covers a box scale wide around it
+        y0 = offsets[0] + .5 - .5 * scales[0]
+        x0 = offsets[1] + .5 - .5 * scales[1]
+        box = (x0, y0, x0 + window[1] * scales[1], y0 + window[0] * scales[0])
+        frame = numpy.empty(window + crop.shape[2:], dtype=numpy.float32)
+        for channel in numpy.ndindex(*crop.shape[2:]):
+            index = (slice(None), slice(None)) + channel
+            resized = Image.fromarray(numpy.ascontiguousarray(crop[index])).resize(
+                (window[1], window[0]), resample, box)
+            frame[index] = numpy.asarray(resized)
+        return cast_like(frame, dtype)
+
+
+class OpenCVBackend(Backend):
+    '''
+    OpenCV's warpAffine with one of its interpolations, if cv2 is installed
+    '''
+    SUPPORT = {'nearest': 1, 'linear': 1, 'cubic': 2, 'lanczos4': 4}
+    def __init__(self, interpolation):
+        self.interpolation = interpolation
+        self.name = 'opencv-' + interpolation
+    def available(self):
+        try:
+            import cv2
+        except ImportError:
+            return False
+        return True
+    def window(self, image, zoom_factor, rows, cols, dtype, threads=1, prepared=None, halo=8):
+        import cv2
+        flags = getattr(cv2, 'INTER_' + self.interpolation.upper()) | cv2.WARP_INVERSE_MAP
+        crop, scales, offsets = padded_crop(image, zoom_factor, rows, cols,
+                                            self.SUPPORT[self.interpolation] + 1)
+        # Maps output (x, y) to crop (x, y)
+        matrix = numpy.array([[scales[1], 0., offsets[1]], [0., scales[0], offsets[0]]])
+        window = (rows[1] - rows[0], cols[1] - cols[0])
+        frame = numpy.empty(window + crop.shape[2:], dtype=numpy.float32)
+        for channel in numpy.ndindex(*crop.shape[2:]):
+            index = (slice(None), slice(None)) + channel
+            frame[index] = cv2.warpAffine(numpy.ascontiguousarray(crop[index]), matrix,
+                                          (window[1], window[0]), flags=flags,
+                                          borderMode=cv2.BORDER_REFLECT_101)
+        return cast_like(frame, dtype)
+
+
+BACKENDS = OrderedDict()
+
+
+def register(backend):
+    '''
+    Adds backend to the registry under its name
+    '''
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+for order in range(6):
+    register(SplineBackend(order))
+register(BinBackend())
+for filter_name in ('nearest', 'bilinear', 'bicubic', 'lanczos'):
+    register(PillowBackend(filter_name))
+for interpolation in ('linear', 'cubic', 'lanczos4'):
+    register(OpenCVBackend(interpolation))
+
+
+def available_backends():
+    return [backend for backend in BACKENDS.values() if backend.available()]
+
+
+def machine_id():
+    '''
+    Hash of what backend speed depends on: host, CPU and library versions
+    '''
+    libraries = [backend.name for backend in available_backends()]
+    for module in ('PIL', 'cv2'):
+        if module in sys.modules:
+            libraries.append('%s %s' % (module, getattr(sys.modules[module], '__version__', '')))
+    description = [platform.node(), platform.machine(), platform.processor(),
+                   str(multiprocessing.cpu_count()), platform.python_version(),
+                   numpy.__version__, scipy.__version__] + libraries
+    return hashlib.sha1('\n'.join(description).encode('utf-8')).hexdigest()[:16]
+
+
+def smooth_image(size, seed=0):
+    '''
+    Random float32 image with no detail finer than about 8 pixels, which
+    every backend can resample by the calibration factors without aliasing
+    '''
+    from scipy.ndimage import gaussian_filter
+    rng = numpy.random.RandomState(seed)
+    image = gaussian_filter(rng.rand(size, size), 4., mode='wrap')
+    return ((image - image.min()) / (image.max() - image.min())).astype(numpy.float32)
+
+
+def backend_error(backend, image, zooms, threads=1, margin=8):
+    '''
+    Largest difference between backend and a quintic spline of image,
+    relative to the image range of 1. Bin frames are compared with the
+    spline at the centres of their pixels, the others on zoom's grid.
+    margin pixels along the edges, which depend on how each backend
+    extends the image, are left out.
+    '''
+    from scipy.ndimage import map_coordinates
+    coefficients = spline_coefficients(image, 5, threads)
+    error = 0.
+    for zoom_factor in zooms:
+        ny, nx = resampled_shape(image.shape, zoom_factor, backend.method)
+        frame = backend.window(image, zoom_factor, (0, ny), (0, nx), numpy.float32, threads,
+                               backend.prepare(image, threads))
+        if backend.method == 'bin':
+            y = (numpy.arange(ny) + .5) / zoom_factor - .5
+            x = (numpy.arange(nx) + .5) / zoom_factor - .5
+        else:
+            y = numpy.arange(ny) * (image.shape[0] - 1.) / (ny - 1.)
+            x = numpy.arange(nx) * (image.shape[1] - 1.) / (nx - 1.)
+        coords = numpy.meshgrid(y[margin:-margin], x[margin:-margin], indexing='ij')
+        truth = map_coordinates(coefficients, coords, order=5, prefilter=False, mode='mirror')
+        error = max(error, float(numpy.abs(frame[margin:-margin, margin:-margin] - truth).max()))
+    return error
+
+
+def calibrate(size=1024, zooms=(.45, .8, 1.6, 2.9), repeat=3, threads=None):
+    '''
+    Times every available backend resampling a size x size float32 image by
+    each of zooms, the best of repeat runs, and measures its error on a
+    smaller image. Returns {name: {'seconds': s, 'error': e}}.
+    '''
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    image = smooth_image(size)
+    results = OrderedDict()
+    for backend in available_backends():
+        # Levels are prepared once and then resampled many times
+        prepared = backend.prepare(image, threads)
+        seconds = 0.
+        for zoom_factor in zooms:
+            ny, nx = resampled_shape(image.shape, zoom_factor, backend.method)
+            times = []
+            for n in range(repeat):
+                start = clock()
+                backend.window(image, zoom_factor, (0, ny), (0, nx), numpy.float32, threads, prepared)
+                times.append(clock() - start)
+            seconds += min(times)
+        error = backend_error(backend, smooth_image(256, seed=1), zooms, threads)
+        results[backend.name] = {'seconds': seconds, 'error': error}
+    return results
+
+
+def calibration_path():
+    return os.path.join(default_cache_dir(), CALIBRATION_FILE)
+
+
+def load_calibration(path=None):
+    '''
+    Calibration results of this machine, or None if it was never calibrated
+    '''
+    try:
+        with open(path or calibration_path()) as f:
+            calibrations = json.load(f)
+    except (IOError, ValueError):
+        return None
+    return calibrations.get(machine_id())
+
+
+def save_calibration(results, path=None):
+    '''
+    Stores results for this machine, next to those of other machines
+    sharing the cache directory
+    '''
+    path = path or calibration_path()
+    try:
+        with open(path) as f:
+            calibrations = json.load(f)
+    except (IOError, ValueError):
+        calibrations = {}
+    calibrations[machine_id()] = {'host': platform.node(), 'time': time.time(), 'backends': results}
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Unique per writer, other machines may be calibrating at the same time
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory or '.')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(calibrations, f, indent=1)
+    os.rename(tmp_path, path)
+
+
+def machine_calibration(recalibrate=False, path=None):
+    '''
+    {name: {'seconds', 'error'}} of this machine, calibrating on first use
+    '''
+    calibration = None if recalibrate else load_calibration(path)
+    if calibration is not None:
+        return calibration['backends']
+    results = calibrate()
+    save_calibration(results, path)
+    return results
+
+
+def select_backend(tier='high', recalibrate=False, path=None):
+    '''
+    Fastest available backend of the accuracy tier on this machine
+    '''
+    if tier not in ACCURACY_TIERS:
+        raise ValueError('Unknown accuracy tier %r, use one of %s' % (tier, ', '.join(ACCURACY_TIERS)))
+    results = machine_calibration(recalibrate, path)
+    candidates = [(result['seconds'], name) for name, result in results.items()
+                  if name in BACKENDS and result['error'] <= ACCURACY_TIERS[tier]
+                  and BACKENDS[name].available()]
+    if not candidates:
+        return BACKENDS['spline3']
+    return BACKENDS[min(candidates)[1]]
+
+
+def get_backend(backend, method='spline'):
+    '''
+    Backend for ImageObject's backend option: a Backend, a registered name,
+    an accuracy tier, or None for the default of method
+    '''
+    if backend is None:
+        return BACKENDS['bin' if method == 'bin' else 'spline3']
+    if isinstance(backend, Backend):
+        return backend
+    if backend in ACCURACY_TIERS:
+        return select_backend(backend)
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend %r, use one of %s or a tier of %s' %
+                         (backend, ', '.join(BACKENDS), ', '.join(ACCURACY_TIERS)))
+    if not BACKENDS[backend].available():
+        raise ValueError('Backend %s is not available, its library is not installed' % backend)
+    return BACKENDS[backend]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrates the resampling backends on this machine')
+    parser.add_argument('--recalibrate', action='store_true',
+                        help='measure again instead of using the stored calibration')
+    args = parser.parse_args()
+    results = machine_calibration(args.recalibrate)
+    print('%-16s %10s %10s  %s' % ('backend', 'seconds', 'error', 'tiers'))
+    for name, result in sorted(results.items(), key=lambda item: item[1]['seconds']):
+        tiers = [tier for tier, bound in ACCURACY_TIERS.items() if result['error'] <= bound]
+        print('%-16s %10.4f %10.2e  %s' % (name, result['seconds'], result['error'], ' '.join(tiers)))
+    for tier in ACCURACY_TIERS:
+        print('%s: %s' % (tier, select_backend(tier).name))
+    print('Calibration in %s' % calibration_path())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+'''
+Benchmarks of the resampling, loading and rendering paths. Results are
+written as JSON so runs of different versions can be compared:
+python benchmark.py --output before.json
+python benchmark.py --output after.json --compare before.json
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+import numpy
+import scipy
+from resample import ImageObject
+from timing import clock
+
+
+def time_call(function, repeat):
+    '''
+    Returns the wall clock times of repeat calls of function
+    '''
+    times = []
+    for i in range(repeat):
+        start = clock()
+        function()
+        times.append(clock() - start)
+    return times
+
+
+def synthetic_image(size, dtype, channels, seed=0):
+    '''
+    Smooth random image, so that spline and binning see realistic content
+    '''
+    rng = numpy.random.RandomState(seed)
+    shape = (size, size) if channels == 1 else (size, size, channels)
+    coarse = rng.rand(*((size // 16 + 1, size // 16 + 1) + shape[2:]))
+    image = numpy.kron(coarse, numpy.ones((16, 16) + (1,) * (len(shape) - 2)))[:size, :size]
+    image = image + .1 * rng.rand(*shape)
+    if numpy.issubdtype(numpy.dtype(dtype), numpy.integer):
+        return (image / image.max() * 255).astype(dtype)
+    return image.astype(dtype)
+
+
+def bench_image(image, pixscale, params, zooms, methods, repeat):
+    '''
+    update_sampling, cold and warm, and resampled_region of image at
+    pixscale by each of zooms with each of methods
+    '''
+    results = []
+    for method in methods:
+        for zoom_factor in zooms:
+            sampling = pixscale / zoom_factor
+            run_params = dict(params, method=method, zoom=zoom_factor)
+            # Cold: a fresh object, including pyramid levels
+            def cold():
+                ImageObject(image, pixscale, method=method).update_sampling(sampling)
+            results.append(result('update_sampling_cold', run_params, time_call(cold, repeat)))
+            obj = ImageObject(image, pixscale, method=method)
+            obj.update_sampling(sampling)
+            results.append(result('update_sampling_warm', run_params,
+                                  time_call(lambda: obj.update_sampling(sampling), repeat)))
+            # A 10 arcsec view, as AppForm asks for after a toolbar zoom
+            results.append(result('resampled_region', run_params,
+                                  time_call(lambda: obj.resampled_region(sampling, (-5., 5.), (-5., 5.)),
+                                            repeat)))
+    return results
+
+
+def bench_update_sampling(sizes, zooms, dtypes, channels, methods, repeat):
+    results = []
+    for size in sizes:
+        for dtype in dtypes:
+            for nchan in channels:
+                image = synthetic_image(size, dtype, nchan)
+                params = {'size': size, 'dtype': dtype, 'channels': nchan}
+                results += bench_image(image, .05, params, zooms, methods, repeat)
+    return results
+
+
+def bench_catalog_sampling(catalog_path, zooms, methods, repeat):
+    '''
+    bench_update_sampling of the catalog images, as the GUIs resample them
+    '''
+    from arraycache import ArrayCache
+    from catalog import Catalog
+    catalog = Catalog(catalog_path, ArrayCache())
+    results = []
+    for name in catalog.names():
+        image = catalog.load(name)
+        # Known once decoded, FITS files may take it from the header
+        pixscale = catalog.entry(name).pixscale
+        results += bench_image(image, pixscale, {'image': name}, zooms, methods, repeat)
+    return results
+
+
+def bench_loading(catalog_path, repeat):
+    '''
+    Decoding catalog images, without and with the on-disk array cache
+    '''
+    from arraycache import ArrayCache
+    from catalog import Catalog
+    results = []
+    cache_dir = tempfile.mkdtemp(prefix='astro_image_sim_bench')
+    plain = Catalog(catalog_path)
+    cached = Catalog(catalog_path, ArrayCache(cache_dir))
+    for name in plain.names():
+        params = {'image': name}
+        results.append(result('decode', params, time_call(lambda: plain.load(name), repeat)))
+        cached.load(name)
+        results.append(result('decode_cached', params, time_call(lambda: cached.load(name), repeat)))
+    return results
+
+
+def bench_render(sizes, repeat):
+    '''
+    Headless Agg draws of an AppForm sized figure, and blits of the FOV
+    square. An approximation of the GUI: there is no Qt canvas, event loop
+    or slider, so it leaves out the time to put the pixels on screen.
+    '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.patches as patches
+    from rendering import BlitManager
+    results = []
+    for size in sizes:
+        fig = Figure((10.0, 10.0), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        axes = fig.add_subplot(111)
+        axes.imshow(synthetic_image(size, 'uint8', 3), interpolation='nearest')
+        square = patches.Rectangle((0, 0), size / 10., size / 10., fill=False, edgecolor='red')
+        axes.add_artist(square)
+        blit = BlitManager(canvas, [square])
+        params = {'size': size}
+        results.append(result('canvas_draw', params, time_call(canvas.draw, repeat)))
+        def move():
+            square.set_xy(numpy.random.rand(2) * size)
+            blit.update()
+        results.append(result('blit_fov_square', params, time_call(move, repeat)))
+    return results
+
+
+def result(name, params, times):
+    return {'name': name, 'params': params, 'best': min(times),
+            'mean': sum(times) / len(times), 'repeat': len(times)}
+
+
+def result_key(entry):
+    return (entry['name'], json.dumps(entry['params'], sort_keys=True))
+
+
+def compare(results, baseline_path):
+    '''
+    Prints the best times against a previous run
+    '''
+    with open(baseline_path) as f:
+        baseline = dict((result_key(entry), entry) for entry in json.load(f)['results'])
+    for entry in results:
+        old = baseline.get(result_key(entry))
+        if old is not None:
+            print('%-22s %-70s %8.4f -> %8.4f s  x%.2f' %
+                  (entry['name'], json.dumps(entry['params'], sort_keys=True),
+                   old['best'], entry['best'], old['best'] / max(entry['best'], 1e-12)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', default='benchmark.json', help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    parser.add_argument('--catalog', default='catalog.json',
+                        help='catalog manifest for load and catalog timings')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help='small sizes only')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['resample', 'catalog', 'load', 'render'])
+    args = parser.parse_args()
+
+    sizes = [256, 1024] if args.quick else [512, 2048, 4096]
+    results = []
+    if 'resample' not in args.skip:
+        results += bench_update_sampling(sizes, [.25, .5, .77, 1.3], ['uint8', 'float32'],
+                                         [1, 3], ['spline', 'bin'], args.repeat)
+    if 'catalog' not in args.skip and os.path.exists(args.catalog):
+        results += bench_catalog_sampling(args.catalog, [.25, .5, .77, 1.3], ['spline', 'bin'],
+                                          args.repeat)
+    if 'load' not in args.skip and os.path.exists(args.catalog):
+        results += bench_loading(args.catalog, args.repeat)
+    if 'render' not in args.skip:
+        results += bench_render(sizes, args.repeat)
+
+    meta = {'python': sys.version.split()[0], 'numpy': numpy.__version__,
+            'scipy': scipy.__version__, 'platform': platform.platform(),
+            'host': socket.gethostname(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    for entry in results:
+        print('%-22s %-70s %8.4f s' % (entry['name'], json.dumps(entry['params'], sort_keys=True), entry['best']))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
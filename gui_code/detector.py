@@ -0,0 +1,87 @@
+'''
+Detector signal model: turns a resampled frame into simulated exposures
+with shot noise, dark current, read noise and gain.
+detector = Detector(flux_scale = 50.)
+exposures = detector.expose(frame, 30., count = 16, seed = 1)
+total, count = detector.coadd(frame, 30., count = 1000, seed = 1)
+'''
+import numpy
+from instrument import H2RG_PITCH, H2RG_NPIX
+
+
+def make_rng(seed=None):
+    '''
+    numpy Generator (PCG64) seeded with seed, or a RandomState on numpy < 1.17
+    '''
+    try:
+        return numpy.random.default_rng(seed)
+    except AttributeError:
+        return numpy.random.RandomState(seed)
+
+
+class Detector:
+    '''
+    Detector with gain (electrons / ADU), dark_current (electrons / s / pix),
+    read_noise (electrons rms per read), full_well (electrons), bias (ADU)
+    and an ADC of adc_bits. Frame values times flux_scale are the photo
+    electrons per second of each pixel. Defaults are typical of a Teledyne H2RG.
+    '''
+    def __init__(self, gain=1.5, dark_current=.01, read_noise=15., full_well=1e5,
+                 bias=1000., adc_bits=16, flux_scale=1., pitch=H2RG_PITCH, npix=H2RG_NPIX):
+        self.gain = gain
+        self.dark_current = dark_current
+        self.read_noise = read_noise
+        self.full_well = full_well
+        self.bias = bias
+        self.adc_bits = adc_bits
+        self.flux_scale = flux_scale
+        self.pitch = pitch
+        self.npix = npix
+    def electrons(self, frame, exptime):
+        '''
+        Mean electrons per pixel collected from frame in exptime seconds
+        '''
+        signal = numpy.asarray(frame, dtype=numpy.float32) * numpy.float32(self.flux_scale)
+        return (numpy.maximum(signal, 0) + numpy.float32(self.dark_current)) * numpy.float32(exptime)
+    def read(self, electrons, rng):
+        '''
+        ADU of exposures holding electrons (any shape): Poisson shot noise,
+        full well saturation, read noise, gain, bias and ADC range
+        '''
+        counts = rng.poisson(electrons).astype(numpy.float32)
+        numpy.minimum(counts, numpy.float32(self.full_well), out=counts)
+        counts += rng.normal(0., self.read_noise, counts.shape).astype(numpy.float32)
+        counts /= numpy.float32(self.gain)
+        counts += numpy.float32(self.bias)
+        return numpy.clip(numpy.round(counts, out=counts), 0, 2 ** self.adc_bits - 1, out=counts)
+    def expose(self, frame, exptime, count=1, seed=None, rng=None):
+        '''
+        Returns count exposures of frame, exptime seconds each, as float32
+        ADU of shape (count,) + frame.shape, drawn in one vectorized call
+        '''
+        if rng is None:
+            rng = make_rng(seed)
+        electrons = self.electrons(frame, exptime)
+        return self.read(numpy.broadcast_to(electrons, (count,) + electrons.shape), rng)
+    def exposures(self, frame, exptime, count, chunk=16, seed=None, rng=None):
+        '''
+        Yields count exposures of frame in blocks of at most chunk, so
+        long sequences never sit in memory at once
+        '''
+        if rng is None:
+            rng = make_rng(seed)
+        electrons = self.electrons(frame, exptime)
+        for first in range(0, count, chunk):
+            n = min(chunk, count - first)
+            yield self.read(numpy.broadcast_to(electrons, (n,) + electrons.shape), rng)
+    def coadd(self, frame, exptime, count, chunk=16, seed=None, rng=None, subtract_bias=True):
+        '''
+        Returns (sum, count): the float64 sum of count exposures of frame,
+        streamed chunk exposures at a time. Divide by count for the mean.
+        '''
+        total = numpy.zeros(numpy.shape(frame), dtype=numpy.float64)
+        for block in self.exposures(frame, exptime, count, chunk, seed, rng):
+            total += block.sum(axis=0, dtype=numpy.float64)
+        if subtract_bias:
+            total -= count * self.bias
+        return total, count
@@ -0,0 +1,98 @@
+import numpy
+
+
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts', '.fits.gz')
+
+
+def import_fits():
+    '''
+    pyfits, or astropy.io.fits. Imported on first use, since either adds
+    a noticeable delay to starting the GUIs.
+    '''
+    try:
+        import pyfits
+    except ImportError:
+        try:
+            from astropy.io import fits as pyfits
+        except ImportError:
+            raise ImportError('Reading FITS files needs pyfits or astropy')
+    return pyfits
+
+
+def is_fits(path):
+    return path.lower().endswith(FITS_EXTENSIONS)
+
+
+def header_pixscale(header):
+    '''
+    Pixel scale in arcsecs/pix from the CD matrix, or CDELT and PC
+    keywords, of a FITS header. Non square pixels give the geometric mean.
+    '''
+    if 'CD1_1' in header or 'CD2_2' in header:
+        det = (header.get('CD1_1', 0.) * header.get('CD2_2', 0.) -
+               header.get('CD1_2', 0.) * header.get('CD2_1', 0.))
+    elif 'CDELT1' in header and 'CDELT2' in header:
+        pc_det = (header.get('PC1_1', 1.) * header.get('PC2_2', 1.) -
+                  header.get('PC1_2', 0.) * header.get('PC2_1', 0.))
+        det = header['CDELT1'] * header['CDELT2'] * pc_det
+    else:
+        raise ValueError('FITS header has no CD or CDELT pixel scale')
+    return numpy.sqrt(abs(det)) * 3600.
+
+
+class FitsSection:
+    '''
+    Array-like view of a FITS image HDU that only reads the sections it is
+    sliced with, so it can be the master_image of an ImageObject without
+    pulling the file into memory. Rows are flipped to the top-down order
+    of the other images, and (channel, y, x) cubes are shown as (y, x, channel).
+    '''
+    def __init__(self, hdu):
+        self.hdu = hdu
+        shape = tuple(hdu.header['NAXIS%d' % n] for n in range(hdu.header['NAXIS'], 0, -1))
+        if len(shape) == 3:
+            shape = shape[1:] + shape[:1]
+        elif len(shape) != 2:
+            raise ValueError('Only 2-D images and 3-D cubes are supported')
+        self.shape = shape
+        self.ndim = len(shape)
+        self.dtype = self[0:1, 0:1].dtype
+        self.nbytes = int(numpy.prod(shape)) * self.dtype.itemsize
+    def _fits_rows(self, rows):
+        start, stop, step = rows.indices(self.shape[0])
+        count = len(range(start, stop, step))
+        if count == 0:
+            return slice(0, 0)
+        last = start + step * (count - 1)
+        return slice(self.shape[0] - 1 - last, self.shape[0] - start, step)
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if not all(isinstance(k, slice) and (k.step or 1) > 0 for k in key):
+            return numpy.asarray(self)[key]
+        rows = self._fits_rows(key[0])
+        if self.ndim == 3:
+            section = numpy.rollaxis(self.hdu.section[key[2], rows, key[1]], 0, 3)
+        else:
+            section = self.hdu.section[rows, key[1]]
+        return section[::-1]
+    def __array__(self, dtype=None, copy=None):
+        return numpy.asarray(self[:, :], dtype=dtype)
+
+
+def open_fits(path, hdu=None):
+    '''
+    Opens a FITS image memory mapped. Returns (FitsSection, pixscale in
+    arcsecs/pix from the header, or None if it has none). By default the
+    first HDU holding an image is used.
+    '''
+    hdulist = import_fits().open(path, memmap=True)
+    if hdu is None:
+        hdu = [n for n, h in enumerate(hdulist) if h.header.get('NAXIS', 0) >= 2][0]
+    image = FitsSection(hdulist[hdu])
+    try:
+        pixscale = header_pixscale(hdulist[hdu].header)
+    except ValueError:
+        pixscale = None
+    return image, pixscale
@@ -3,19 +3,17 @@ from __future__ import print_function
 import sys
 
 from matplotlib.figure import Figure
-from matplotlib.backend_bases import key_press_handler
 from matplotlib.backends.backend_qt4agg import (
     FigureCanvasQTAgg as FigureCanvas,
     NavigationToolbar2QT as NavigationToolbar)
 from matplotlib.backends import qt4_compat
-from matplotlib import animation
 import matplotlib.patches as patches
 use_pyside = qt4_compat.QT_API == qt4_compat.QT_API_PYSIDE
 import numpy
-from scipy import misc
 from resample import ImageObject
-from matplotlib.widgets import Slider, Button, RadioButtons
-from matplotlib import gridspec
+from catalog import Catalog
+from arraycache import ArrayCache
+from instrument import Instrument
 
 if use_pyside:
     from PySide.QtCore import *
@@ -35,6 +33,11 @@ class AppForm(QMainWindow):
     '''
     def __init__(self, parent=None):
         QMainWindow.__init__(self, parent)
+        # Images offered in image_selection_menu, decoded on demand.
+        # Decoded arrays are kept in the on-disk cache shared by all GUIs.
+        self.catalog = Catalog('catalog.json', ArrayCache())
+        # Telescope and detector the pixel scale is calculated for
+        self.instrument = Instrument()
         # Creates GUI framework
         self.create_main_frame()
         # Plots initial image
@@ -60,24 +63,8 @@ class AppForm(QMainWindow):
 
         # Image selection dropdown box
         self.image_selection_menu = QComboBox()
-
-        self.image_selection_menu.addItem('Galaxy Simulation 1')
-        self.image_selection_menu.addItem('Galaxy Simulation 2')
-        self.image_selection_menu.addItem('Galaxy Image 1')
-        self.image_selection_menu.addItem('Galaxy Image 2')
-        self.image_selection_menu.addItem('Jupiter Simulation')
-        self.image_selection_menu.addItem('Jupiter Image 1')
-        self.image_selection_menu.addItem('Jupiter Image 2')
-        self.image_selection_menu.addItem('Star Formation Simulation 1')
-        self.image_selection_menu.addItem('Star Formation Simulation 2')
-        self.image_selection_menu.addItem('Star Formation Simulation 3')
-        self.image_selection_menu.addItem('Star Formation Image 1')
-        self.image_selection_menu.addItem('Star Formation Image 2')
-        self.image_selection_menu.addItem('Star Formation Image 3')
-        self.image_selection_menu.addItem('Galaxy Cluster Image')
-        self.image_selection_menu.addItem('Galaxy Cluster Simulation')
-
-
+        for name in self.catalog.names():
+            self.image_selection_menu.addItem(name)
         self.image_selection_menu.activated[str].connect(self.image_selection)
         vbox.addWidget(self.image_selection_menu)
 
@@ -109,25 +96,18 @@ class AppForm(QMainWindow):
             imsize = self.imsizebox.text()
             objsize = self.objsizebox.text()
             try: 
-                imsize = float(imsize)
-                objsize = float(objsize)
-                objsize *= 3600.
-                scale = objsize / imsize # arseconds / mm
-                pixscale = scale * 18.3e-6 # arcseconds / pixel. 18.3 micron pixel size of H2RG 
-                fov = 2048. * pixscale
+                screening = self.instrument.screen_image(float(objsize), float(imsize), self.obj)
+                pixscale = float(screening.pixscale)
+                fov = float(screening.fov)
                 if pixscale != self.obj.current_sampling:
-                    if pixscale > self.obj.master_sampling:
+                    if not screening.oversampled:
                         self.obj.update_sampling(pixscale)
-                        self.imshow.set_data(self.obj.current_image)                
-                        self.oversampled = False
-                    else:
-                        self.oversampled = True
-                if fov < self.obj.xsize_arcsecs:
+                        self.show_current()
+                    self.oversampled = bool(screening.oversampled)
+                if not screening.fov_too_large:
                     self.update_fov_square_size(fov)
                     self.current_fov = fov
-                    self.fov_too_large = False
-                else:
-                    self.fov_too_large = True
+                self.fov_too_large = bool(screening.fov_too_large)
                 self.canvas.draw()
             except:
                 QMessageBox.about(self, 'Error','Image size and object size must be numbers')
@@ -158,10 +138,9 @@ class AppForm(QMainWindow):
         self.image_axes = self.fig.add_subplot(111)
         # Initial image 
         # FIXME add null image
-        self.current_pixscale = .05
         self.current_image_name = 'Galaxy Image 1'
-#        im = misc.imread('galaxy_simulations/im1.jpg')
-        im = misc.imread('galaxy_images/im1.jpg')
+        self.current_pixscale = self.catalog.entry(self.current_image_name).pixscale
+        im = self.catalog.load(self.current_image_name)
         self.obj = ImageObject(im, self.current_pixscale)
         self.image_object = self.obj.current_image
         
@@ -169,6 +148,7 @@ class AppForm(QMainWindow):
         self.imshow = self.image_axes.imshow(self.image_object, interpolation='nearest', 
                                              extent = [-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2.,
                                                        -self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.])
+        self.show_current()
         self.image_axes.set_title(self.current_image_name)
         self.image_axes.set_xlabel('Arcsecs')
         self.image_axes.set_ylabel('Arcsecs')
@@ -181,7 +161,7 @@ class AppForm(QMainWindow):
         def update(val):
             if self.sample_slider.val != self.obj.current_sampling:
                 self.obj.update_sampling(self.sample_slider.val)
-                self.imshow.set_data(self.obj.current_image)
+                self.show_current()
             fov = self.fov_slider.val 
             self.update_fov_square_size(fov)
             self.current_fov = fov
@@ -216,115 +196,40 @@ class AppForm(QMainWindow):
         self.current_yloc = new_yloc
         self.fov_square.set_xy((new_xloc, new_yloc))
 
+    def show_current(self):
+        '''
+        Displays the current image of obj, colormapping single channel data
+        '''
+        self.imshow.set_data(self.obj.current_image)
+        if self.obj.cmap is not None:
+            self.imshow.set_cmap(self.obj.cmap)
+            self.imshow.set_clim(self.obj.clim)
+
     def image_selection(self, image_name):
-        ''' 
-        Hacked together image selection. 
-        Takes selection from the image_selection_menu widget 
         '''
+        Takes selection from the image_selection_menu widget and loads it
+        from the catalog, then starts decoding its menu neighbours
+        '''
+        image_name = str(image_name)
         self.image_axes.set_title(image_name)
+        entry = self.catalog.entry(image_name)
+        im = self.catalog.load(image_name)
+        self.obj = ImageObject(im, entry.pixscale)
+        self.catalog.prefetch(self.catalog.neighbours(image_name))
+        self.image_update()
 
-        if image_name == 'Galaxy Image 1':
-            im = misc.imread('galaxy_images/im1.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Image 2':
-            im = misc.imread('galaxy_images/im2.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Image 3':
-            im = misc.imread('galaxy_images/im3.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Image 4':
-            im = misc.imread('galaxy_images/im4.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Simulation 1':
-            im = misc.imread('galaxy_simulations/im1.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Simulation 2':
-            im = misc.imread('galaxy_simulations/im2.jpg')
-            pixscale = .01
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Jupiter Simulation':
-            im = misc.imread('jupiter_simulation/jupiter_zoomout.png')
-            pixscale = .02
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Jupiter Image 1':
-            im = misc.imread('jupiter_images/im1.jpg')
-            pixscale = .02
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Jupiter Image 2':
-            im = misc.imread('jupiter_images/im2.jpg')
-            pixscale = .005
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Simulation 1':
-            im = misc.imread('star_formation_simulation/im1.gif')
-            pixscale = .004 
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 2':
-            im = misc.imread('star_formation_simulation/im2.gif')
-            pixscale = .004
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Star Formation Simulation 3':
-            im = misc.imread('star_formation_simulation/im3.gif')
-            pixscale = .004
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 1':
-            im = misc.imread('star_formation_images/im1.jpg')
-            pixscale = .002
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 2':
-            im = misc.imread('star_formation_images/im2.jpg')
-            pixscale = .002
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Star Formation Image 3':
-            im = misc.imread('star_formation_images/im3.jpg')
-            pixscale = .002
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-
-        if image_name == 'Galaxy Cluster Image':
-            im = misc.imread('cosmology_images/im1.jpg')
-            pixscale = .005
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
-        if image_name == 'Galaxy Cluster Simulation':
-            im = misc.imread('cosmology_simulation/actual_im1.jpg')
-            pixscale = .005
-            self.obj = ImageObject(im, pixscale)
-            self.image_update()
     def image_update(self):
         '''
         Helper function to image selection, resets image and sliders
         '''
-        self.imshow.set_data(self.obj.current_image)
+        self.show_current()
         self.imshow.set_extent([-self.obj.xsize_arcsecs / 2., self.obj.xsize_arcsecs / 2., 
                                 -self.obj.ysize_arcsecs / 2., self.obj.ysize_arcsecs / 2.])
         self.canvas.draw()
         if self.obj.master_sampling != self.current_pixscale:
             self.current_pixscale = self.obj.master_sampling
             def update(val):
-                self.imshow.set_data(self.obj.current_image)
+                self.show_current()
                 self.canvas.draw()
         else:
             pass
@@ -0,0 +1,90 @@
+from collections import namedtuple
+import numpy
+
+
+# Teledyne H2RG detector
+H2RG_PITCH = 18.3e-6 # meters
+H2RG_NPIX = 2048
+
+
+def plate_scale(objsize, imsize, pitch=H2RG_PITCH, npix=H2RG_NPIX):
+    '''
+    Returns (pixscale, fov) in arcsecs/pix and arcsecs for an object
+    objsize degrees across that is imaged imsize meters across on a
+    detector of npix pixels of size pitch (meters). Arrays broadcast.
+    '''
+    scale = numpy.asarray(objsize, dtype=float) * 3600. / numpy.asarray(imsize, dtype=float) # arcsecs / meter
+    pixscale = scale * pitch
+    return pixscale, npix * pixscale
+
+
+Screening = namedtuple('Screening', ['pixscale', 'fov', 'oversampled', 'fov_too_large'])
+
+
+class Instrument:
+    '''
+    Telescope and detector: pixel pitch (meters), detector format npix
+    (pixels a side), and optionally the focal_length
+    and aperture diameter (meters) of the telescope. Every method takes
+    arrays, so thousands of designs are screened in one call:
+    instrument = Instrument()
+    result = instrument.screen(objsizes[:, None], imsizes[None, :], .05, 30.)
+    '''
+    def __init__(self, pitch=H2RG_PITCH, npix=H2RG_NPIX, focal_length=None, aperture=None,
+                 name='H2RG'):
+        self.pitch = pitch
+        self.npix = npix
+        self.focal_length = focal_length
+        self.aperture = aperture
+        self.name = name
+    @property
+    def detector_size(self):
+        '''
+        Width of the detector in meters
+        '''
+        return self.npix * self.pitch
+    @property
+    def focal_ratio(self):
+        if self.focal_length is None or self.aperture is None:
+            return None
+        return self.focal_length / self.aperture
+    def image_size(self, objsize):
+        '''
+        Meters across the image of an object objsize degrees across, from
+        the focal length
+        '''
+        if self.focal_length is None:
+            raise ValueError('%s has no focal length' % self.name)
+        return numpy.radians(numpy.asarray(objsize, dtype=float)) * self.focal_length
+    def plate_scale(self, objsize, imsize=None):
+        '''
+        Returns (pixscale, fov) in arcsecs/pix and arcsecs. Without imsize
+        the image size comes from the focal length.
+        '''
+        if imsize is None:
+            imsize = self.image_size(objsize)
+        return plate_scale(objsize, imsize, self.pitch, self.npix)
+    def screen(self, objsize, imsize=None, master_sampling=None, image_arcsecs=None):
+        '''
+        Screening of object sizes (degrees) against image sizes (meters),
+        broadcast together. Returns a Screening of arrays: pixscale, fov,
+        oversampled (pixscale finer than the master_sampling of the source
+        image) and fov_too_large (fov wider than image_arcsecs).
+        '''
+        pixscale, fov = self.plate_scale(objsize, imsize)
+        if master_sampling is None:
+            oversampled = numpy.zeros(pixscale.shape, dtype=bool)
+        else:
+            oversampled = pixscale < master_sampling
+        if image_arcsecs is None:
+            fov_too_large = numpy.zeros(fov.shape, dtype=bool)
+        else:
+            fov_too_large = fov >= image_arcsecs
+        return Screening(pixscale, fov, oversampled, fov_too_large)
+    def screen_image(self, objsize, imsize, obj):
+        '''
+        screen against the ImageObject obj. The detector is square, so its
+        field of view has to fit inside the narrower side of the image.
+        '''
+        return self.screen(objsize, imsize, obj.master_sampling,
+                           min(obj.xsize_arcsecs, obj.ysize_arcsecs))
@@ -0,0 +1,210 @@
+'''
+Out-of-core resampling of masters larger than memory. The master is read
+in strips of rows from a memmapped .npy or a FITS section, each strip is
+resampled with enough overlap for the spline prefilter and the PSF, and the
+frame is written strip by strip to a memmapped .npy, so the peak memory is
+set by the strip size rather than the image size. To use:
+image, sampling = open_master('mosaic.fits')
+frame = stream_resample(image, sampling, .1, 'mosaic_0.1.npy')
+or from the command line:
+python streaming.py mosaic.fits mosaic_0.1.npy --sampling .1
+Frames match ImageObject.resampled to float32 rounding.
+'''
+from __future__ import print_function
+
+import argparse
+import time
+import numpy
+from numpy.lib.format import open_memmap
+from fitsimage import is_fits, open_fits
+from psf import convolve, kernel_halo
+from kernels import (bin_window, cast_like, downsample2, resampled_shape, spline_coefficients,
+                     zoom_window)
+
+
+# Master rows read per strip, which sets the memory used
+STRIP_ROWS = 512
+# Rows read past each end of a strip for the spline prefilter. Its
+# influence falls by 0.268 per row, so 24 rows leave errors below 1e-13.
+PREFILTER_HALO = 24
+
+
+def open_master(path, hdu=None):
+    '''
+    Returns (image, pixscale or None) of a .npy file opened as a read-only
+    memmap, or of a FITS image read by sections
+    '''
+    if is_fits(path):
+        return open_fits(path, hdu)
+    return numpy.load(path, mmap_mode='r'), None
+
+
+class RowWindow:
+    '''
+    Array-like stand-in for an image of shape that only holds its rows
+    first:first + len(rows), for zoom_window and bin_window to slice with
+    the row numbers of the whole image
+    '''
+    def __init__(self, rows, first, shape):
+        self.rows = rows
+        self.first = first
+        self.shape = tuple(shape)
+        self.ndim = len(shape)
+        self.dtype = rows.dtype
+    def __getitem__(self, key):
+        start, stop, step = key[0].indices(self.shape[0])
+        if start < self.first or stop > self.first + len(self.rows):
+            raise IndexError('Rows %d:%d are outside the strip %d:%d' %
+                             (start, stop, self.first, self.first + len(self.rows)))
+        return self.rows[(slice(start - self.first, stop - self.first, step),) + tuple(key[1:])]
+
+
+def level_count(shape, sampling, new_sampling):
+    '''
+    Pyramid level ImageObject.pyramid_level resamples from for new_sampling
+    '''
+    level = 0
+    while sampling * 2 ** (level + 1) <= new_sampling * (1. + 1e-9):
+        if min(shape[:2]) >> level < 2:
+            break
+        level += 1
+    return level
+
+
+class LevelReader:
+    '''
+    Reads rows of pyramid level level of image, binning the master rows
+    under them on the fly, optionally convolved with psf at level sampling
+    '''
+    def __init__(self, image, level, sampling, psf=None):
+        self.image = image
+        self.level = level
+        self.sampling = sampling * 2 ** level
+        self.psf = psf
+        shape = numpy.shape(image)
+        self.shape = (shape[0] >> level, shape[1] >> level) + tuple(shape[2:])
+        self.margin = 0 if psf is None else kernel_halo(psf, self.sampling)
+    def read(self, first, last):
+        '''
+        Level rows first:last, as the image dtype. Binning 2**level master
+        rows at a time with downsample2 rounds exactly like the pyramid.
+        '''
+        scale = 2 ** self.level
+        rows = numpy.asarray(self.image[first * scale:last * scale, :self.shape[1] * scale])
+        for n in range(self.level):
+            rows = downsample2(rows)
+        return rows
+    def window(self, first, last):
+        '''
+        (rows, first) of level rows first:last clipped to the level. Rows
+        convolved with the PSF are read with a margin, which is then cut off.
+        '''
+        first = max(first, 0)
+        last = min(last, self.shape[0])
+        if self.psf is None:
+            return self.read(first, last), first
+        lo = max(first - self.margin, 0)
+        hi = min(last + self.margin, self.shape[0])
+        rows = convolve(self.read(lo, hi), self.psf, self.sampling)
+        return cast_like(rows[first - lo:last - lo], self.image.dtype), first
+
+
+def source_rows(shape, out_shape, zoom_factor, first, last, method):
+    '''
+    Level rows (lo, hi) that output rows first:last of zoom_window or
+    bin_window read
+    '''
+    if method == 'bin':
+        width = 1. / zoom_factor
+        return int(numpy.floor(first * width + 1e-6)), int(numpy.ceil(last * width - 1e-6))
+    scale = (shape[0] - 1.) / (out_shape[0] - 1.) if out_shape[0] > 1 else 0.
+    return int(numpy.floor(first * scale)), int(numpy.ceil((last - 1) * scale)) + 1
+
+
+def resample_rows(reader, new_sampling, out_shape, first, last, method, dtype, halo=PREFILTER_HALO):
+    '''
+    Output rows first:last of the level of reader resampled to new_sampling,
+    as dtype. Spline rows are prefiltered from halo extra rows on each side.
+    '''
+    zoom_factor = reader.sampling / new_sampling
+    if reader.sampling == new_sampling:
+        rows, start = reader.window(first, last)
+        return numpy.asarray(rows, dtype=dtype)
+    lo, hi = source_rows(reader.shape, out_shape, zoom_factor, first, last, method)
+    cols = (0, out_shape[1])
+    if method == 'bin':
+        rows, start = reader.window(lo, hi)
+        frame = bin_window(RowWindow(rows, start, reader.shape), zoom_factor, (first, last), cols)
+        return cast_like(frame * numpy.float32(zoom_factor ** 2), dtype)
+    # The cubic kernel reaches 2 rows past the ones under the output
+    rows, start = reader.window(lo - 2 - halo, hi + 2 + halo)
+    coefficients = RowWindow(spline_coefficients(rows), start, reader.shape)
+    return zoom_window(coefficients, zoom_factor, (first, last), cols, prefiltered=True, output=dtype)
+
+
+def stream_resample(image, sampling, new_sampling, path, method='spline', psf=None,
+                    strip_rows=STRIP_ROWS, progress=None):
+    '''
+    Writes image at sampling arcsecs/pix resampled to new_sampling to the
+    .npy file path, strip_rows master rows at a time, and returns the frame
+    as a read-only memmap. Downsampling goes through the same pyramid level
+    and PSF stage as ImageObject.resampled. progress(rows done, rows) is
+    called after every strip.
+    '''
+    level = level_count(numpy.shape(image), sampling, new_sampling)
+    reader = LevelReader(image, level, sampling)
+    frame_psf = None
+    if psf is not None:
+        if psf.well_sampled(new_sampling):
+            frame_psf = psf
+        else:
+            reader = LevelReader(image, level, sampling, psf)
+    zoom_factor = reader.sampling / new_sampling
+    out_shape = resampled_shape(reader.shape, zoom_factor, method) + reader.shape[2:]
+    frame = open_memmap(path, mode='w+', dtype=image.dtype, shape=out_shape)
+    # strip_rows master rows give this many output rows
+    step = max(int(strip_rows * sampling / new_sampling), 1)
+    margin = 0 if frame_psf is None else kernel_halo(frame_psf, new_sampling)
+    for first in range(0, out_shape[0], step):
+        last = min(first + step, out_shape[0])
+        if frame_psf is None:
+            frame[first:last] = resample_rows(reader, new_sampling, out_shape, first, last, method,
+                                              image.dtype)
+        else:
+            # Convolving a margin as wide as the kernel keeps the strip exact
+            lo = max(first - margin, 0)
+            hi = min(last + margin, out_shape[0])
+            rows = resample_rows(reader, new_sampling, out_shape, lo, hi, method, numpy.float32)
+            rows = convolve(rows, frame_psf, new_sampling)[first - lo:last - lo]
+            frame[first:last] = cast_like(rows, image.dtype)
+        if progress is not None:
+            progress(last, out_shape[0])
+    frame.flush()
+    del frame
+    return numpy.load(path, mmap_mode='r')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resamples a .npy or FITS image too large for memory')
+    parser.add_argument('input', help='.npy or FITS master image')
+    parser.add_argument('output', help='.npy file to write the frame to')
+    parser.add_argument('--sampling', type=float, required=True, help='new sampling in arcsecs/pix')
+    parser.add_argument('--pixscale', type=float,
+                        help='sampling of the input in arcsecs/pix, by default from the FITS header')
+    parser.add_argument('--method', default='spline', choices=['spline', 'bin'])
+    parser.add_argument('--strip-rows', type=int, default=STRIP_ROWS,
+                        help='master rows read at a time')
+    args = parser.parse_args()
+    image, pixscale = open_master(args.input)
+    pixscale = args.pixscale or pixscale
+    if pixscale is None:
+        parser.error('%s has no pixel scale, give --pixscale' % args.input)
+    start = time.time()
+    frame = stream_resample(image, pixscale, args.sampling, args.output, args.method,
+                            strip_rows=args.strip_rows)
+    print('%s -> %s %s in %.1f s' % ('x'.join(str(n) for n in numpy.shape(image)), args.output,
+                                     'x'.join(str(n) for n in frame.shape), time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
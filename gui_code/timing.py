@@ -0,0 +1,124 @@
+'''
+Timing spans around the hot paths (decoding, resampling, set_data,
+canvas draws), kept in a ring buffer. Disabled by default, when a span is
+a shared no-op. To use:
+from timing import timer
+timer.enabled = True
+with timer.span('resample'):
+    ...
+or decorate functions with @timed('resample').
+print(timer.stats())
+timer.export_trace('trace.json') # chrome://tracing or Perfetto
+Setting ASTRO_IMAGE_SIM_TIMING=1 in the environment enables the timer at import.
+'''
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_span = NullSpan()
+
+
+class Span:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+    def __enter__(self):
+        self.start = clock()
+        return self
+    def __exit__(self, *exc_info):
+        self.timer.record(self.name, self.start, clock() - self.start)
+        return False
+
+
+class Timer:
+    '''
+    Ring buffer of the last capacity spans as (name, start, seconds,
+    thread id)
+    '''
+    def __init__(self, capacity=10000, enabled=False):
+        self.spans = deque(maxlen=capacity)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+    def span(self, name):
+        '''
+        Context manager timing its block as name, if the timer is enabled
+        '''
+        if not self.enabled:
+            return _null_span
+        return Span(self, name)
+    def record(self, name, start, seconds):
+        # deque.append is atomic, the lock only guards snapshots
+        self.spans.append((name, start, seconds, threading.current_thread().ident))
+    def snapshot(self):
+        with self.lock:
+            return list(self.spans)
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+    def stats(self, percentiles=(50, 90, 99)):
+        '''
+        Returns {name: {'count', 'mean', 'max', 'p50', ...}} in milliseconds
+        '''
+        durations = {}
+        for name, start, seconds, thread in self.snapshot():
+            durations.setdefault(name, []).append(seconds * 1e3)
+        stats = {}
+        for name, values in durations.items():
+            values = numpy.array(values)
+            stats[name] = {'count': len(values), 'mean': values.mean(), 'max': values.max()}
+            for p, value in zip(percentiles, numpy.percentile(values, percentiles)):
+                stats[name]['p%d' % p] = value
+        return stats
+    def format_stats(self):
+        '''
+        stats() as a fixed width table
+        '''
+        lines = ['%-16s %6s %8s %8s %8s %8s' % ('span (ms)', 'count', 'p50', 'p90', 'p99', 'max')]
+        for name, stat in sorted(self.stats().items()):
+            lines.append('%-16s %6d %8.1f %8.1f %8.1f %8.1f' %
+                         (name, stat['count'], stat['p50'], stat['p90'], stat['p99'], stat['max']))
+        return '\n'.join(lines)
+    def export_trace(self, path):
+        '''
+        Writes the spans as a Chrome trace event file
+        '''
+        events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': seconds * 1e6,
+                   'pid': os.getpid(), 'tid': thread}
+                  for name, start, seconds, thread in self.snapshot()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+timer = Timer(enabled=os.environ.get('ASTRO_IMAGE_SIM_TIMING', '') not in ('', '0'))
+
+
+def timed(name):
+    '''
+    Decorator timing every call of the function as name
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not timer.enabled:
+                return function(*args, **kwargs)
+            with Span(timer, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,268 @@
+'''
+Resampling kernels shared by ImageObject, the backends and streaming:
+the 2x pyramid step, flux binning over pixel overlaps and cubic spline
+zooms of windows of an image, optionally split into tiles resampled on a
+thread pool. They only read the part of the input under the window, so
+they work on memmaps and FITS sections as well as arrays.
+'''
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy
+from scipy.ndimage import affine_transform, spline_filter1d
+from scipy import sparse
+
+
+# Output tiles resampled concurrently are at most TILE_SIZE pixels a side
+TILE_SIZE = 512
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def thread_pool(threads):
+    '''
+    Shared pool of threads workers. scipy.ndimage releases the GIL, so
+    tiles resampled on it run in parallel.
+    '''
+    with _pools_lock:
+        if threads not in _pools:
+            _pools[threads] = ThreadPool(threads)
+        return _pools[threads]
+
+
+def downsample2(image):
+    '''
+    Halves the resolution of image by averaging 2x2 pixel blocks.
+    An odd last row or column is dropped.
+    '''
+    ny = numpy.shape(image)[0] // 2 * 2
+    nx = numpy.shape(image)[1] // 2 * 2
+    blocks = numpy.asarray(image[:ny, :nx], dtype=numpy.float32)
+    binned = (blocks[0::2, 0::2] + blocks[1::2, 0::2] + 
+              blocks[0::2, 1::2] + blocks[1::2, 1::2]) / 4.
+    return cast_like(binned, image.dtype)
+
+
+def cast_like(frame, dtype):
+    '''
+    Converts a float frame back to dtype, rounding and clipping to the
+    range of integer types
+    '''
+    if numpy.issubdtype(dtype, numpy.integer):
+        info = numpy.iinfo(dtype)
+        frame = numpy.clip(numpy.round(frame), info.min, info.max)
+    return frame.astype(dtype)
+
+
+def resampled_shape(shape, zoom_factor, method='spline'):
+    '''
+    Returns the (rows, columns) of image shape resampled by zoom_factor.
+    Binning only keeps output pixels that are fully covered.
+    '''
+    if method == 'bin':
+        return (int(shape[0] * zoom_factor + 1e-6), int(shape[1] * zoom_factor + 1e-6))
+    return (int(round(shape[0] * zoom_factor)), int(round(shape[1] * zoom_factor)))
+
+
+def overlap_matrix(n_in, n_out, zoom_factor, first=0, origin=0):
+    '''
+    Sparse (n_out, n_in) matrix holding the fraction of each input pixel
+    that falls inside each output pixel, for output pixels 1 / zoom_factor
+    input pixels wide. The matrix starts at output pixel first and input
+    pixel origin.
+    '''
+    width = 1. / zoom_factor
+    edges = (first + numpy.arange(n_out + 1)) * width - origin
+    start = numpy.floor(edges[:-1]).astype(int)
+    # Input pixels touched by one output pixel
+    ntouch = int(numpy.ceil(width)) + 1
+    cols = start[:, None] + numpy.arange(ntouch)[None, :]
+    weights = (numpy.minimum(edges[1:, None], cols + 1.) -
+               numpy.maximum(edges[:-1, None], cols))
+    rows = numpy.repeat(numpy.arange(n_out), ntouch).reshape(cols.shape)
+    keep = (weights > 0) & (cols >= 0) & (cols < n_in)
+    return sparse.csr_matrix((weights[keep].astype(numpy.float32), (rows[keep], cols[keep])),
+                             shape=(n_out, n_in))
+
+
+def _apply_along_first_axis(matrix, array):
+    flat = array.reshape(array.shape[0], -1)
+    return numpy.asarray(matrix.dot(flat)).reshape((matrix.shape[0],) + array.shape[1:])
+
+
+def bin_window(image, zoom_factor, rows, cols):
+    '''
+    Returns rows[0]:rows[1], cols[0]:cols[1] of the flux binned frame,
+    using the pixel overlap areas and reading only the input under the window
+    '''
+    width = 1. / zoom_factor
+    slices = []
+    matrices = []
+    for axis, (first, last) in enumerate((rows, cols)):
+        lo = int(numpy.floor(first * width + 1e-6))
+        hi = min(int(numpy.ceil(last * width - 1e-6)), numpy.shape(image)[axis])
+        slices.append(slice(lo, hi))
+        matrices.append(overlap_matrix(hi - lo, last - first, zoom_factor, first, lo))
+    crop = numpy.asarray(image[tuple(slices)], dtype=numpy.float32)
+    frame = _apply_along_first_axis(matrices[0], crop)
+    frame = _apply_along_first_axis(matrices[1], frame.swapaxes(0, 1))
+    return frame.swapaxes(0, 1)
+
+
+def bin_resample(image, zoom_factor, conserve_flux=True):
+    '''
+    Resamples image by integrating it over the output pixels, the way a
+    detector does. Integer binning factors use a reshape and sum, any other
+    factor uses the exact overlap area of input and output pixels.
+    With conserve_flux each output pixel holds the summed flux of the input
+    it covers, otherwise the mean (surface brightness is conserved).
+    '''
+    factor = 1. / zoom_factor
+    nbin = int(round(factor))
+    ny, nx = resampled_shape(numpy.shape(image), zoom_factor, 'bin')
+    if nbin >= 1 and abs(factor - nbin) < 1e-6:
+        blocks = numpy.asarray(image[:ny * nbin, :nx * nbin], dtype=numpy.float32)
+        blocks = blocks.reshape((ny, nbin, nx, nbin) + blocks.shape[2:])
+        frame = blocks.sum(axis=3).sum(axis=1)
+    else:
+        frame = bin_window(image, zoom_factor, (0, ny), (0, nx))
+    if not conserve_flux:
+        frame = frame * numpy.float32(zoom_factor ** 2)
+    return frame
+
+
+def _prefilter_lines(array, order, axis):
+    try:
+        spline_filter1d(array, order, axis, output=array, mode='constant')
+    except TypeError:
+        # scipy < 1.6 has no mode, and always prefilters that way
+        spline_filter1d(array, order, axis, output=array)
+
+
+def spline_coefficients(image, order=3, threads=1):
+    '''
+    Cubic B-spline prefilter of image along its two image axes, as zoom
+    computes it internally, stored in float32. Channels need no prefilter
+    since they are only ever interpolated at whole channel positions.
+    Lines along an axis are independent, so with threads > 1 each pass is
+    split into strips across the other axis.
+    '''
+    coefficients = numpy.array(image, dtype=numpy.float32)
+    for axis in (0, 1):
+        edges = numpy.linspace(0, coefficients.shape[1 - axis], threads + 1).astype(int)
+        strips = []
+        for first, last in zip(edges[:-1], edges[1:]):
+            strip = [slice(None), slice(None)]
+            strip[1 - axis] = slice(first, last)
+            strips.append(coefficients[tuple(strip)])
+        if threads > 1:
+            thread_pool(threads).map(lambda strip: _prefilter_lines(strip, order, axis), strips)
+        else:
+            _prefilter_lines(coefficients, order, axis)
+    return coefficients
+
+
+def zoom_window(image, zoom_factor, rows, cols, halo=8, order=3, prefiltered=False, output=None):
+    '''
+    Returns rows[0]:rows[1], cols[0]:cols[1] of 
+    zoom(image, (zoom_factor, zoom_factor, ...)), reading only the input
+    under the window plus halo pixels on each side for the spline prefilter.
+    If image already holds spline_coefficients, only the kernel support is
+    read and the result is exact; output sets the dtype.
+    '''
+    if prefiltered:
+        halo = order // 2 + 2
+    shape = numpy.shape(image)
+    out_shape = resampled_shape(shape, zoom_factor)
+    if order == 0:
+        return nearest_zoom_window(image, shape, out_shape, rows, cols, output)
+    slices = []
+    scales = []
+    offsets = []
+    for axis, (first, last) in enumerate((rows, cols)):
+        # zoom maps the corner pixels of input and output onto each other
+        if out_shape[axis] > 1:
+            scale = (shape[axis] - 1.) / (out_shape[axis] - 1.)
+        else:
+            scale = 0.
+        lo = max(int(numpy.floor(first * scale)) - halo, 0)
+        hi = min(int(numpy.ceil((last - 1) * scale)) + halo + 1, shape[axis])
+        slices.append(slice(lo, hi))
+        scales.append(scale)
+        offsets.append(first * scale - lo)
+    crop = numpy.asarray(image[tuple(slices)])
+    window = (rows[1] - rows[0], cols[1] - cols[0])
+    if output is None:
+        output = crop.dtype
+    frame = numpy.empty(window + crop.shape[2:], dtype=output)
+    # One 2-D spline per channel gives the same values as zoom's spline
+    # across channels, at a quarter of the cost. Inside the input, mirror
+    # interpolates exactly like zoom's constant mode, but it also keeps the
+    # last row and column when the crop offset rounds them just past the edge.
+    for channel in numpy.ndindex(*crop.shape[2:]):
+        index = (slice(None), slice(None)) + channel
+        frame[index] = affine_transform(crop[index], scales, offset=offsets, output_shape=window,
+                                        output=frame.dtype, order=order, mode='mirror',
+                                        prefilter=not prefiltered)
+    return frame
+
+
+def nearest_zoom_window(image, shape, out_shape, rows, cols, output=None):
+    '''
+    zoom_window for order 0. The input pixel of every output pixel is
+    rounded from its coordinate in the whole output, not in the window, so
+    tiles break rounding ties exactly like a single window.
+    '''
+    indices = []
+    for (first, last), n_in, n_out in zip((rows, cols), shape[:2], out_shape):
+        scale = (n_in - 1.) / (n_out - 1.) if n_out > 1 else 0.
+        index = numpy.floor(numpy.arange(first, last) * scale + .5).astype(int)
+        indices.append(numpy.clip(index, 0, n_in - 1))
+    # Read only the input under the window, then pick from it
+    starts = [index[0] if len(index) else 0 for index in indices]
+    stops = [index[-1] + 1 if len(index) else 0 for index in indices]
+    crop = numpy.asarray(image[starts[0]:stops[0], starts[1]:stops[1]])
+    frame = crop[indices[0] - starts[0]][:, indices[1] - starts[1]]
+    if output is not None:
+        frame = frame.astype(output, copy=False)
+    return frame
+
+
+def zoom_tiled(image, zoom_factor, rows, cols, threads, tile=TILE_SIZE, **kwargs):
+    '''
+    zoom_window computed as tiles of at most tile x tile output pixels
+    on threads threads. Every tile reads its own halo, so the stitched frame
+    is the same as a single zoom_window.
+    '''
+    row_edges = list(range(rows[0], rows[1], tile)) + [rows[1]]
+    col_edges = list(range(cols[0], cols[1], tile)) + [cols[1]]
+    tiles = [((r0, r1), (c0, c1)) for r0, r1 in zip(row_edges[:-1], row_edges[1:])
+             for c0, c1 in zip(col_edges[:-1], col_edges[1:])]
+    if threads <= 1 or len(tiles) == 1:
+        return zoom_window(image, zoom_factor, rows, cols, **kwargs)
+    dtype = kwargs.get('output')
+    if dtype is None:
+        dtype = image.dtype
+    frame = numpy.empty((rows[1] - rows[0], cols[1] - cols[0]) + numpy.shape(image)[2:], dtype=dtype)
+    def resample_tile(tile):
+        (r0, r1), (c0, c1) = tile
+        frame[r0 - rows[0]:r1 - rows[0], c0 - cols[0]:c1 - cols[0]] = \
+            zoom_window(image, zoom_factor, (r0, r1), (c0, c1), **kwargs)
+    thread_pool(threads).map(resample_tile, tiles)
+    return frame
+
+
+def nearest_window(image, zoom_factor, rows, cols):
+    '''
+    Fast, low quality stand-in for zoom_window: rows[0]:rows[1],
+    cols[0]:cols[1] of image resampled by zoom_factor taking the input
+    pixel under each output pixel centre
+    '''
+    shape = numpy.shape(image)
+    indices = []
+    for (first, last), n in zip((rows, cols), shape[:2]):
+        index = ((numpy.arange(first, last) + .5) / zoom_factor).astype(int)
+        indices.append(numpy.minimum(index, n - 1))
+    # Read only the input under the window, then pick from it
+    crop = numpy.asarray(image[indices[0][0]:indices[0][-1] + 1, indices[1][0]:indices[1][-1] + 1])
+    return crop[indices[0] - indices[0][0]][:, indices[1] - indices[1][0]]
@@ -0,0 +1,218 @@
+'''
+Point spread functions for ImageObject, applied by FFT convolution:
+obj = ImageObject(im, pixscale, psf = GaussianPSF(.8))
+The spectra of the kernels are cached per (PSF, sampling, frame shape), so
+moving the sampling slider back and forth does not rebuild them.
+'''
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy
+from scipy.ndimage import zoom
+from scipy.special import j1
+try:
+    from scipy.fft import rfft2, irfft2, next_fast_len
+except ImportError:
+    # scipy < 1.4
+    from numpy.fft import rfft2, irfft2
+    from scipy.fftpack import next_fast_len
+
+
+# Default memory budget for kernel spectra
+DEFAULT_SPECTRA_BYTES = 64 * 1024 ** 2
+
+ARCSECS_PER_RADIAN = 180. / numpy.pi * 3600.
+
+
+def radial_kernel(profile, radius, sampling, oversample=5):
+    '''
+    Normalized kernel of the radial profile(r in arcsecs) out to radius
+    arcsecs, at sampling arcsecs/pix. Every pixel averages oversample**2
+    samples, so PSFs narrower than a pixel still integrate correctly.
+    '''
+    half = max(int(numpy.ceil(radius / sampling)), 1)
+    n = (2 * half + 1) * oversample
+    offsets = (numpy.arange(n) - (n - 1) / 2.) * sampling / oversample
+    r = numpy.hypot(offsets[:, None], offsets[None, :])
+    fine = profile(r)
+    kernel = fine.reshape(2 * half + 1, oversample, 2 * half + 1, oversample).mean(axis=(1, 3))
+    return kernel / kernel.sum()
+
+
+class PSF:
+    '''
+    Base of the PSFs: kernel(sampling) returns the normalized kernel at
+    sampling arcsecs/pix, and key identifies the PSF in caches.
+    '''
+    fwhm = 0.
+    key = None
+    def well_sampled(self, sampling):
+        '''
+        True if the PSF is Nyquist sampled at sampling, so it can be
+        applied to the resampled frame instead of the master
+        '''
+        return self.fwhm >= 2. * sampling
+    def kernel(self, sampling):
+        raise NotImplementedError
+
+
+class GaussianPSF(PSF):
+    '''
+    Seeing disk: a circular Gaussian fwhm arcsecs across
+    '''
+    def __init__(self, fwhm):
+        self.fwhm = float(fwhm)
+        self.key = ('gaussian', self.fwhm)
+    def kernel(self, sampling):
+        sigma = self.fwhm / (2. * numpy.sqrt(2. * numpy.log(2.)))
+        return radial_kernel(lambda r: numpy.exp(-r ** 2 / (2. * sigma ** 2)), 4. * sigma, sampling)
+
+
+class AiryPSF(PSF):
+    '''
+    Diffraction pattern of a circular aperture diameter meters across at
+    wavelength meters, with an optional central obscuration (fraction of
+    the diameter). The kernel is cut off after rings dark rings.
+    '''
+    def __init__(self, wavelength, diameter, obscuration=0., rings=8):
+        self.wavelength = float(wavelength)
+        self.diameter = float(diameter)
+        self.obscuration = float(obscuration)
+        self.rings = rings
+        # lambda / D in arcsecs
+        self.scale = self.wavelength / self.diameter * ARCSECS_PER_RADIAN
+        self.fwhm = 1.029 * self.scale
+        self.key = ('airy', self.wavelength, self.diameter, self.obscuration, rings)
+    def profile(self, r):
+        x = numpy.pi * numpy.maximum(r, 1e-12) / self.scale
+        amplitude = 2. * j1(x) / x
+        if self.obscuration > 0:
+            e = self.obscuration
+            amplitude = amplitude - e ** 2 * 2. * j1(e * x) / (e * x)
+        return amplitude ** 2
+    def kernel(self, sampling):
+        # The n-th dark ring is close to (n + .22) lambda / D
+        return radial_kernel(self.profile, (self.rings + .22) * self.scale, sampling)
+
+
+class KernelPSF(PSF):
+    '''
+    User supplied 2-D kernel sampled at sampling arcsecs/pix. It is
+    resampled to each frame's sampling with a cubic spline.
+    '''
+    def __init__(self, kernel, sampling, fwhm=None):
+        self.image = numpy.array(kernel, dtype=numpy.float64)
+        if self.image.ndim != 2:
+            raise ValueError('PSF kernels must be 2-D')
+        self.sampling = float(sampling)
+        if fwhm is None:
+            # Diameter of the area above half maximum
+            above = numpy.count_nonzero(self.image >= self.image.max() / 2.)
+            fwhm = 2. * numpy.sqrt(above / numpy.pi) * self.sampling
+        self.fwhm = fwhm
+        self.key = ('kernel', self.sampling, self.image.shape,
+                    hashlib.sha1(self.image.tobytes()).hexdigest())
+    def kernel(self, sampling):
+        zoom_factor = self.sampling / sampling
+        if abs(zoom_factor - 1.) < 1e-9:
+            kernel = self.image
+        else:
+            kernel = numpy.maximum(zoom(self.image, zoom_factor, order=3), 0)
+            if kernel.size == 0 or kernel.sum() == 0:
+                kernel = numpy.ones((1, 1))
+        return kernel / kernel.sum()
+
+
+class SpectrumCache:
+    '''
+    Memory bounded LRU cache of kernel spectra, keyed by PSF, quantized
+    sampling and frame shape. Shared between ImageObjects.
+    '''
+    def __init__(self, max_bytes=DEFAULT_SPECTRA_BYTES, quantum=1e-4):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.spectra = OrderedDict()
+        self.nbytes = 0
+        # Kernel shapes by (PSF, quantized sampling), for kernel_halo
+        self.kernel_shapes = {}
+        self.lock = threading.Lock()
+    def kernel_shape(self, psf, sampling):
+        '''
+        Shape of the kernel of psf at sampling, built once
+        '''
+        key = (psf.key, int(round(sampling / self.quantum)))
+        with self.lock:
+            shape = self.kernel_shapes.get(key)
+        if shape is None:
+            shape = psf.kernel(sampling).shape
+            with self.lock:
+                self.kernel_shapes[key] = shape
+        return shape
+    def get(self, psf, sampling, shape):
+        '''
+        Returns (spectrum, kernel shape, padded shape) for convolving
+        frames of shape (rows, columns) with psf at sampling
+        '''
+        key = (psf.key, int(round(sampling / self.quantum)), tuple(shape))
+        with self.lock:
+            entry = self.spectra.pop(key, None)
+            if entry is not None:
+                self.spectra[key] = entry
+                return entry
+        kernel = psf.kernel(sampling)
+        # Padding to a fast FFT length also keeps the convolution linear
+        padded = tuple(next_fast_len(n + k - 1) for n, k in zip(shape, kernel.shape))
+        spectrum = rfft2(kernel.astype(numpy.float32), padded)
+        entry = (spectrum, kernel.shape, padded)
+        with self.lock:
+            self.kernel_shapes[key[:2]] = kernel.shape
+            # Another thread may have built it meanwhile
+            stored = self.spectra.get(key)
+            if stored is not None:
+                return stored
+            if spectrum.nbytes <= self.max_bytes:
+                self.spectra[key] = entry
+                self.nbytes += spectrum.nbytes
+                while self.nbytes > self.max_bytes:
+                    old_key, old_entry = self.spectra.popitem(last=False)
+                    self.nbytes -= old_entry[0].nbytes
+        return entry
+    def clear(self):
+        with self.lock:
+            self.spectra.clear()
+            self.kernel_shapes.clear()
+            self.nbytes = 0
+
+
+default_spectra = SpectrumCache()
+
+
+def kernel_halo(psf, sampling, spectra=None):
+    '''
+    Pixels a frame at sampling needs around a region for convolving it
+    with psf to be exact inside the region
+    '''
+    if spectra is None:
+        spectra = default_spectra
+    return max(spectra.kernel_shape(psf, sampling)) // 2
+
+
+def convolve(frame, psf, sampling, spectra=None):
+    '''
+    Returns frame (rows, columns[, channels]) at sampling arcsecs/pix
+    convolved with psf as float32, same size as frame. Outside the frame
+    is taken to be dark sky.
+    '''
+    if spectra is None:
+        spectra = default_spectra
+    image = numpy.asarray(frame, dtype=numpy.float32)
+    shape = image.shape[:2]
+    spectrum, kernel_shape, padded = spectra.get(psf, sampling, shape)
+    if image.ndim == 3:
+        spectrum = spectrum[:, :, None]
+    transform = rfft2(image, padded, axes=(0, 1))
+    transform *= spectrum
+    full = irfft2(transform, padded, axes=(0, 1))
+    cy = kernel_shape[0] // 2
+    cx = kernel_shape[1] // 2
+    return numpy.asarray(full[cy:cy + shape[0], cx:cx + shape[1]], dtype=numpy.float32)
@@ -0,0 +1,73 @@
+from kernels import bin_resample, cast_like
+
+
+class BlitManager:
+    '''
+    Redraws a few animated artists over a cached copy of the rest of the
+    figure instead of re-rendering everything. To use:
+    blit = BlitManager(canvas, [fov_square])
+    fov_square.set_xy(newloc)
+    blit.update()
+    Every full canvas.draw() (new image or sampling) refreshes the cached
+    background.
+    '''
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.cid = canvas.mpl_connect('draw_event', self.on_draw)
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+    def draw_artists(self):
+        for artist in self.artists:
+            artist.axes.draw_artist(artist)
+    def update(self):
+        '''
+        Restores the background and draws only the animated artists
+        '''
+        if self.background is None:
+            # Nothing cached yet, on_draw takes care of the artists
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+def screen_footprint(axes, extent):
+    '''
+    Screen pixels (columns, rows) that extent covers in axes at the
+    current view limits
+    '''
+    # The box the axes will actually be drawn in, after fixing its aspect
+    axes.apply_aspect()
+    bbox = axes.get_window_extent()
+    x0, x1 = axes.get_xlim()
+    y0, y1 = axes.get_ylim()
+    columns = bbox.width * abs(extent[1] - extent[0]) / max(abs(x1 - x0), 1e-12)
+    rows = bbox.height * abs(extent[3] - extent[2]) / max(abs(y1 - y0), 1e-12)
+    return columns, rows
+
+
+def decimate_to_axes(frame, extent, axes):
+    '''
+    Returns (frame, extent) averaged over blocks of the largest integer
+    size that still leaves a frame pixel for every screen pixel of axes.
+    Agg then never rasterizes more pixels than it can show, and averaging
+    instead of skipping pixels does not alias. Frames that are already
+    small enough are returned unchanged.
+    '''
+    columns, rows = screen_footprint(axes, extent)
+    factor = int(min(frame.shape[1] / max(columns, 1.), frame.shape[0] / max(rows, 1.)))
+    if factor < 2:
+        return frame, extent
+    binned = cast_like(bin_resample(frame, 1. / factor, conserve_flux=False), frame.dtype)
+    # Binning drops the last incomplete blocks on the right and bottom
+    xpix = (extent[1] - extent[0]) / frame.shape[1]
+    ypix = (extent[3] - extent[2]) / frame.shape[0]
+    extent = [extent[0], extent[0] + binned.shape[1] * factor * xpix,
+              extent[3] - binned.shape[0] * factor * ypix, extent[3]]
+    return binned, extent
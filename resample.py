@@ -1,16 +1,126 @@
-import matplotlib.pyplot as plot
+import itertools
+import multiprocessing
+import threading
 import numpy
-import pyfits
-from scipy.ndimage import zoom
-from scipy import misc
-from matplotlib.widgets import Slider, Button, RadioButtons
+from backends import get_backend
+from fitsimage import open_fits
+from kernels import bin_resample, cast_like, downsample2, nearest_window, resampled_shape
+from psf import convolve, kernel_halo
+from timing import timed
 
 
+def is_gray(image, tolerance=0, rows=256):
+    '''
+    True if every channel of the (y, x, channel) image is within tolerance
+    of the first, checked rows at a time to keep temporaries small
+    '''
+    for first in range(0, image.shape[0], rows):
+        block = numpy.asarray(image[first:first + rows], dtype=numpy.float32)
+        if numpy.abs(block[:, :, 1:] - block[:, :, :1]).max() > tolerance:
+            return False
+    return True
 
 
+def compact_image(image):
+    '''
+    Smallest representation of a decoded image: an opaque alpha channel
+    is dropped, RGB images of gray data become a single (y, x) channel and
+    float64 becomes float32. Integer images may differ by one level between
+    channels and still count as gray, as JPEG encoders leave them.
+    Images read on demand, such as a FitsSection, are returned unchanged.
+    '''
+    if not isinstance(image, numpy.ndarray):
+        return image
+    if image.dtype == numpy.float64:
+        image = image.astype(numpy.float32)
+    if image.ndim == 3 and image.shape[2] in (2, 4):
+        opaque = numpy.iinfo(image.dtype).max if numpy.issubdtype(image.dtype, numpy.integer) else 1.
+        if (image[:, :, -1] == opaque).all():
+            image = image[:, :, :-1]
+    if image.ndim == 3 and image.shape[2] == 1:
+        image = image[:, :, 0]
+    elif image.ndim == 3 and image.shape[2] == 3:
+        tolerance = 1 if numpy.issubdtype(image.dtype, numpy.integer) else 0
+        if is_gray(image, tolerance):
+            # The mean of the channels, computed without a float copy of the image
+            gray = numpy.empty(image.shape[:2], dtype=image.dtype)
+            for first in range(0, image.shape[0], 256):
+                block = image[first:first + 256].astype(numpy.float32).mean(axis=2)
+                gray[first:first + 256] = cast_like(block, image.dtype)
+            image = gray
+    return numpy.ascontiguousarray(image)
+
+
+def display_limits(image):
+    '''
+    (vmin, vmax) for showing a single channel image: the full range of
+    8 bit images, otherwise the range of the data
+    '''
+    if image.dtype == numpy.uint8:
+        return 0., 255.
+    finite = numpy.asarray(image)[numpy.isfinite(image)]
+    if finite.size == 0:
+        return 0., 1.
+    return float(finite.min()), float(finite.max())
+
+
+class LevelSection:
+    '''
+    Array-like pyramid level of a master read on demand, such as a
+    FitsSection. Slicing it reads and bins only the master section under the
+    slice, so a level never holds the whole image. With psf the section is
+    convolved at sampling, with a margin as wide as the kernel so that the
+    slice is exact.
+    '''
+    def __init__(self, master, level, psf=None, sampling=None):
+        self.master = master
+        self.level = level
+        self.psf = psf
+        self.sampling = sampling
+        shape = numpy.shape(master)
+        self.shape = (shape[0] >> level, shape[1] >> level) + tuple(shape[2:])
+        self.ndim = len(self.shape)
+        self.dtype = master.dtype
+        self.nbytes = int(numpy.prod(self.shape)) * self.dtype.itemsize
+    def read(self, rows, cols):
+        # Sections aligned to 2**level master pixels bin exactly like downsample2 levels
+        scale = 2 ** self.level
+        section = numpy.asarray(self.master[rows[0] * scale:rows[1] * scale,
+                                            cols[0] * scale:cols[1] * scale])
+        for n in range(self.level):
+            section = downsample2(section)
+        return section
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if not all(isinstance(k, slice) and (k.step or 1) == 1 for k in key[:2]):
+            return numpy.asarray(self)[key]
+        (y0, y1, step), (x0, x1, step) = [k.indices(n) for k, n in zip(key[:2], self.shape)]
+        y1 = max(y1, y0)
+        x1 = max(x1, x0)
+        if self.psf is None:
+            section = self.read((y0, y1), (x0, x1))
+        else:
+            margin = kernel_halo(self.psf, self.sampling)
+            wy0, wy1 = max(y0 - margin, 0), min(y1 + margin, self.shape[0])
+            wx0, wx1 = max(x0 - margin, 0), min(x1 + margin, self.shape[1])
+            window = convolve(self.read((wy0, wy1), (wx0, wx1)), self.psf, self.sampling)
+            section = cast_like(window[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0], self.dtype)
+        return section[(slice(None), slice(None)) + key[2:]]
+    def __array__(self, dtype=None, copy=None):
+        return numpy.asarray(self[:, :], dtype=dtype)
+
+
+_object_keys = itertools.count()
+
 
 class ImageObject:
-    def __init__(self, image, sampling):
+    def __init__(self, image, sampling, key=None, cache=None, method='spline', threads=None, psf=None,
+                 compact=True, backend=None):
+        # Gray and single channel data is stored and resampled as one channel
+        if compact:
+            image = compact_image(image)
         self.master_image = image
         self.current_image = image
         self.master_sampling = sampling
@@ -20,17 +130,305 @@ class ImageObject:
         self.ysize_arcsecs = imsize[0] * sampling 
         self.current_xsize_arcsecs = imsize[1] * sampling
         self.current_ysize_arcsecs = imsize[0] * sampling
-    def update_sampling(self, new_sampling):
-        zoom_factor = self.master_sampling / new_sampling
+        # imshow extent of current_image, which may only cover part of the master
+        self.current_extent = [-self.xsize_arcsecs / 2., self.xsize_arcsecs / 2.,
+                               -self.ysize_arcsecs / 2., self.ysize_arcsecs / 2.]
+        if not isinstance(image, numpy.ndarray):
+            # Master read on demand (e.g. a FitsSection): start from a strided
+            # preview instead of pulling the whole image into memory
+            step = max(int(numpy.ceil(max(imsize[:2]) / 1024.)), 1)
+            self.current_image = image[::step, ::step]
+            self.current_sampling = sampling * step
+        # Single channel images are colormapped when they are displayed,
+        # with the same limits for every frame so resampling keeps the look
+        if len(imsize) == 2:
+            self.cmap = 'gray'
+            self.clim = display_limits(self.current_image)
+        else:
+            self.cmap = None
+            self.clim = None
+        # Pyramid of pre-downsampled copies of the master, built lazily.
+        # Level n is the master binned by 2**n, at sampling * 2**n. Masters
+        # read on demand get LevelSections instead, which bin as they are read.
+        self.pyramid = {0: image}
+        # Backend data (e.g. spline coefficients) of each in-memory pyramid
+        # level, by level sampling and the key of the PSF the level is convolved with
+        self.coefficients = {}
+        # Pyramid levels convolved with PSFs too narrow for the output sampling
+        self.convolved = {}
+        # Resampled frames are shared through cache (a FrameCache) under
+        # key, e.g. the catalog name of the image
+        if key is None:
+            key = next(_object_keys)
+        # backend resamples the windows: a name or accuracy tier from
+        # backends.py. By default 'spline' interpolates with a cubic spline,
+        # 'bin' integrates the master over the new pixels like a detector.
+        self.backend = get_backend(backend, method)
+        self.method = self.backend.method
+        self.image_key = (key, sampling, self.backend.name)
+        self.cache = cache
+        # Spline frames and prefilters are split over threads threads,
+        # all cores by default
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        self.threads = threads
+        # pyramid_lock only guards the dictionaries above. Levels, PSF
+        # convolutions and coefficients are computed outside it, so previews
+        # are not held up by a resample on another thread, and pending holds
+        # an Event for each of them being computed.
+        self.pyramid_lock = threading.Lock()
+        self.pending = {}
+        self.set_psf(psf)
+    @classmethod
+    def from_fits(cls, path, sampling=None, hdu=None, **kwargs):
+        '''
+        ImageObject of a memory mapped FITS image. sampling defaults to the
+        pixel scale in the header, and only the sections needed by
+        resampled_region are read from disk.
+        '''
+        image, pixscale = open_fits(path, hdu)
+        if sampling is None:
+            if pixscale is None:
+                raise ValueError('%s has no pixel scale in its header' % path)
+            sampling = pixscale
+        return cls(image, sampling, **kwargs)
+    def computed(self, name, store, key, compute, psf_key=None):
+        '''
+        store[key], calling compute() outside pyramid_lock on first use.
+        Other threads asking for it meanwhile wait for the result instead of
+        computing it again. Results for psf_key are only kept while that is
+        still the PSF of the object.
+        '''
+        while True:
+            with self.pyramid_lock:
+                if key in store:
+                    return store[key]
+                event = self.pending.get((name, key))
+                owner = event is None
+                if owner:
+                    event = self.pending[(name, key)] = threading.Event()
+            if owner:
+                break
+            # If the computing thread fails, the loop computes it here
+            event.wait()
+        try:
+            value = compute()
+            with self.pyramid_lock:
+                if psf_key is None or psf_key == self.key[-1]:
+                    store[key] = value
+            return value
+        finally:
+            with self.pyramid_lock:
+                del self.pending[(name, key)]
+            event.set()
+    def pyramid_level(self, new_sampling, build=True):
+        '''
+        Returns (sampling, image) of the coarsest pyramid level that is still
+        at or finer than new_sampling, building levels as they are needed.
+        Without build, only levels that are already built are used.
+        '''
+        level = 0
+        image = self.pyramid[0]
+        on_demand = not isinstance(image, numpy.ndarray)
+        while self.master_sampling * 2 ** (level + 1) <= new_sampling * (1. + 1e-9):
+            if min(numpy.shape(image)[:2]) < 2:
+                break
+            if on_demand:
+                image = LevelSection(self.pyramid[0], level + 1)
+                level += 1
+                continue
+            if not build and level + 1 not in self.pyramid:
+                break
+            image = self.computed('pyramid', self.pyramid, level + 1,
+                                  lambda image=image: downsample2(image))
+            level += 1
+        return self.master_sampling * 2 ** level, image
+    def set_psf(self, psf):
+        '''
+        Sets the PSF (see psf.py) resampled frames are convolved with,
+        or None for none
+        '''
+        psf_key = None if psf is None else psf.key
+        with self.pyramid_lock:
+            self.psf = psf
+            self.key = self.image_key + (psf_key,)
+            # Levels convolved with an earlier PSF are no use any more
+            for key in list(self.coefficients):
+                if key[1] not in (None, psf_key):
+                    del self.coefficients[key]
+            for key in list(self.convolved):
+                if key[1] != psf_key:
+                    del self.convolved[key]
+    def source_level(self, new_sampling):
+        '''
+        Returns (sampling, image, level_psf, frame_psf) to resample to
+        new_sampling. A PSF that is well sampled at new_sampling is left to
+        apply to the resampled frame as frame_psf. A narrower one is applied
+        to the pyramid level first, which is then returned with it as level_psf.
+        '''
+        level_sampling, level_image = self.pyramid_level(new_sampling)
+        psf = self.psf
+        if psf is None or psf.well_sampled(new_sampling):
+            return level_sampling, level_image, None, psf
+        if not isinstance(level_image, numpy.ndarray):
+            # Convolved as it is read, like the level itself
+            level = getattr(level_image, 'level', 0)
+            return level_sampling, LevelSection(self.pyramid[0], level, psf, level_sampling), psf, None
+        def compute():
+            return cast_like(convolve(level_image, psf, level_sampling), level_image.dtype)
+        convolved = self.computed('convolved', self.convolved, (level_sampling, psf.key), compute,
+                                  psf.key)
+        return level_sampling, convolved, psf, None
+    def level_coefficients(self, level_sampling, level_image, level_psf=None):
+        '''
+        What the backend prepares for a pyramid level, such as its spline
+        coefficients, computed on first use. None for masters that are read
+        from disk on demand.
+        '''
+        if not isinstance(level_image, numpy.ndarray):
+            return None
+        psf_key = None if level_psf is None else level_psf.key
+        return self.computed('coefficients', self.coefficients, (level_sampling, psf_key),
+                             lambda: self.backend.prepare(level_image, self.threads), psf_key)
+    def resample_window(self, new_sampling, level_sampling, level_image, level_psf, rows, cols,
+                        dtype, halo=8):
+        '''
+        rows, cols of the level resampled to new_sampling, as dtype
+        '''
+        if level_sampling == new_sampling:
+            return numpy.asarray(level_image[rows[0]:rows[1], cols[0]:cols[1]], dtype=dtype)
+        zoom_factor = level_sampling / new_sampling
+        prepared = self.level_coefficients(level_sampling, level_image, level_psf)
+        return self.backend.window(level_image, zoom_factor, rows, cols, dtype, self.threads,
+                                   prepared, halo)
+    @timed('resample')
+    def resampled(self, new_sampling):
+        '''
+        Returns the master resampled to new_sampling without touching the
+        current image, so it can run on a worker thread
+        '''
+        if self.cache is not None:
+            frame = self.cache.get(self.key, new_sampling)
+            if frame is not None:
+                return frame
+        frame = self.full_frame(new_sampling)
+        # Pyramid levels returned as they are would be made read-only
+        levels = list(self.pyramid.values())
+        if (self.cache is not None and isinstance(frame, numpy.ndarray) and
+                all(frame is not level for level in levels)):
+            self.cache.put(self.key, new_sampling, frame)
+        return frame
+    def full_frame(self, new_sampling):
+        '''
+        resampled(new_sampling), computed without the cache
+        '''
+        level_sampling, level_image, level_psf, frame_psf = self.source_level(new_sampling)
+        if level_sampling == new_sampling and frame_psf is None:
+            if isinstance(level_image, LevelSection):
+                return numpy.asarray(level_image)
+            return level_image
+        zoom_factor = level_sampling / new_sampling
+        ny, nx = resampled_shape(numpy.shape(level_image), zoom_factor, self.method)
+        # The PSF is applied before rounding to the image dtype
+        dtype = level_image.dtype if frame_psf is None else numpy.float32
+        if self.method == 'bin' and level_sampling != new_sampling:
+            frame = cast_like(bin_resample(level_image, zoom_factor, conserve_flux=False), dtype)
+        else:
+            frame = self.resample_window(new_sampling, level_sampling, level_image, level_psf,
+                                         (0, ny), (0, nx), dtype)
+        if frame_psf is not None:
+            frame = cast_like(convolve(frame, frame_psf, new_sampling), level_image.dtype)
+        return frame
+    @timed('resample_region')
+    def resampled_region(self, new_sampling, xlim, ylim, halo=8, preview=False):
+        '''
+        Returns (frame, extent): the part of resampled(new_sampling) that
+        covers xlim, ylim (arcsecs from the image centre) and its imshow
+        extent. Only the master pixels under the region, plus a halo for
+        the interpolation kernel, are resampled. With preview, the frame is
+        a nearest neighbour pick from the closest pyramid level that is
+        already built, without the PSF, which takes milliseconds; a cached
+        full frame is still used. Missing levels are left to the full resample.
+        '''
+        if preview:
+            level_sampling, level_image = self.pyramid_level(new_sampling, build=False)
+            level_psf = frame_psf = None
+        else:
+            level_sampling, level_image, level_psf, frame_psf = self.source_level(new_sampling)
+        zoom_factor = level_sampling / new_sampling
+        ny, nx = resampled_shape(numpy.shape(level_image), zoom_factor, self.method)
+        # Whatever its size, the full frame spans the extent of the master
+        xpix = self.xsize_arcsecs / nx
+        ypix = self.ysize_arcsecs / ny
+        x0 = min(max(int(numpy.floor((min(xlim) + self.xsize_arcsecs / 2.) / xpix)), 0), nx - 1)
+        x1 = min(max(int(numpy.ceil((max(xlim) + self.xsize_arcsecs / 2.) / xpix)), x0 + 1), nx)
+        y0 = min(max(int(numpy.floor((self.ysize_arcsecs / 2. - max(ylim)) / ypix)), 0), ny - 1)
+        y1 = min(max(int(numpy.ceil((self.ysize_arcsecs / 2. - min(ylim)) / ypix)), y0 + 1), ny)
+        extent = [-self.xsize_arcsecs / 2. + x0 * xpix, -self.xsize_arcsecs / 2. + x1 * xpix,
+                  self.ysize_arcsecs / 2. - y1 * ypix, self.ysize_arcsecs / 2. - y0 * ypix]
+        if frame_psf is None and level_sampling == new_sampling:
+            return level_image[y0:y1, x0:x1], extent
+        # Regions are cached by their window, next to the full frames
+        region_key = self.key + ((y0, y1, x0, x1),)
+        if self.cache is not None:
+            found, frame = self.cache.get_any([self.key, region_key], new_sampling, count=not preview)
+            if found == 0:
+                return frame[y0:y1, x0:x1], extent
+            if found == 1:
+                return frame, extent
+        if preview:
+            return nearest_window(level_image, zoom_factor, (y0, y1), (x0, x1)), extent
+        if (y0, y1, x0, x1) == (0, ny, 0, nx):
+            # The whole image, which is cached as the full frame for every later region
+            frame = self.full_frame(new_sampling)
+            if self.cache is not None:
+                self.cache.put(self.key, new_sampling, frame)
+            return frame, extent
+        if frame_psf is None:
+            frame = self.resample_window(new_sampling, level_sampling, level_image, level_psf,
+                                         (y0, y1), (x0, x1), level_image.dtype, halo)
+        else:
+            # Convolving a margin as wide as the kernel keeps the region exact
+            margin = kernel_halo(frame_psf, new_sampling)
+            wy0, wy1 = max(y0 - margin, 0), min(y1 + margin, ny)
+            wx0, wx1 = max(x0 - margin, 0), min(x1 + margin, nx)
+            window = self.resample_window(new_sampling, level_sampling, level_image, level_psf,
+                                          (wy0, wy1), (wx0, wx1), numpy.float32, halo)
+            frame = convolve(window, frame_psf, new_sampling)[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+            frame = cast_like(frame, level_image.dtype)
+        if self.cache is not None:
+            self.cache.put(region_key, new_sampling, frame)
+        return frame, extent
+    def update_sampling(self, new_sampling, preview=False):
+        '''
+        Resamples the current image to new_sampling. preview is a quick
+        nearest neighbour version, see resampled_region.
+        '''
+        if preview:
+            self.update_region(new_sampling, (-self.xsize_arcsecs / 2., self.xsize_arcsecs / 2.),
+                               (-self.ysize_arcsecs / 2., self.ysize_arcsecs / 2.), preview)
+            return
+        self.current_image = self.resampled(new_sampling)
+        self.current_sampling = new_sampling
+        self.current_extent = [-self.xsize_arcsecs / 2., self.xsize_arcsecs / 2.,
+                               -self.ysize_arcsecs / 2., self.ysize_arcsecs / 2.]
+    def update_region(self, new_sampling, xlim, ylim, preview=False):
+        '''
+        Like update_sampling, but only resamples the region xlim, ylim
+        '''
+        self.current_image, self.current_extent = self.resampled_region(new_sampling, xlim, ylim,
+                                                                        preview=preview)
         self.current_sampling = new_sampling
-        self.current_image = zoom(self.master_image, (zoom_factor, zoom_factor, 1.))
     def display_current(self):
-        plot.imshow(self.current_image)
+        # pyplot is slow to import and picks a backend, so only when asked
+        import matplotlib.pyplot as plot
+        plot.imshow(self.current_image, cmap=self.cmap, clim=self.clim)
     def return_image(self):
         return self.current_image
 
 
 def image_obj_test(sampling):
+    from scipy import misc
     wfc3_pixscale = .05
     im = misc.imread('hubble_galaxies/ngc6050.jpg')
     obj = ImageObject(im, wfc3_pixscale)
@@ -39,6 +437,9 @@ def image_obj_test(sampling):
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plot
+    from matplotlib.widgets import Slider
+    from scipy import misc
     #testing slider
     wfc3_pixscale = .05
     im = misc.imread('hubble_galaxies/ngc6050.jpg')
@@ -0,0 +1,77 @@
+'''
+Checks of the on-disk cache of decoded catalog images
+'''
+import os
+import threading
+import time
+import numpy
+from arraycache import ArrayCache
+
+
+class Decoder:
+    '''
+    Decodes the whitespace separated numbers of a text file, counting calls
+    '''
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.calls = 0
+    def __call__(self, path):
+        self.calls += 1
+        time.sleep(self.delay)
+        return numpy.loadtxt(path, ndmin=2)
+
+
+def write_source(path, values, mtime=None):
+    with open(path, 'w') as f:
+        f.write(' '.join(str(value) for value in values))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_hits_are_read_only_memmaps(tmpdir):
+    source = str(tmpdir.join('image.txt'))
+    write_source(source, [1, 2, 3])
+    decode = Decoder()
+    cache = ArrayCache(str(tmpdir.join('cache')))
+    first = cache.load(source, decode)
+    second = ArrayCache(str(tmpdir.join('cache'))).load(source, decode)
+    assert decode.calls == 1
+    assert isinstance(second, numpy.memmap) and not second.flags.writeable
+    assert numpy.array_equal(first, second)
+
+
+def test_changed_files_are_decoded_again(tmpdir):
+    source = str(tmpdir.join('image.txt'))
+    write_source(source, [1, 2, 3], mtime=1e9)
+    decode = Decoder()
+    cache = ArrayCache(str(tmpdir.join('cache')))
+    cache.load(source, decode)
+    # Same size, new mtime and content
+    write_source(source, [4, 5, 6], mtime=1e9 + 10)
+    assert numpy.array_equal(cache.load(source, decode), [[4, 5, 6]])
+    # New size
+    write_source(source, [7, 8, 9, 10], mtime=1e9 + 10)
+    assert numpy.array_equal(cache.load(source, decode), [[7, 8, 9, 10]])
+    assert decode.calls == 3
+    # Touching a file rehashes it but finds the same array
+    write_source(source, [7, 8, 9, 10], mtime=1e9 + 20)
+    cache.load(source, decode)
+    assert decode.calls == 3
+
+
+def test_concurrent_misses_decode_once(tmpdir):
+    source = str(tmpdir.join('image.txt'))
+    write_source(source, [1, 2, 3])
+    decode = Decoder(delay=.2)
+    cache = ArrayCache(str(tmpdir.join('cache')))
+    arrays = []
+    threads = [threading.Thread(target=lambda: arrays.append(cache.load(source, decode)))
+               for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert decode.calls == 1
+    assert all(numpy.array_equal(array, [[1, 2, 3]]) for array in arrays)
+    # Only the index and the array are left, no temporary files
+    assert len(os.listdir(str(tmpdir.join('cache')))) == 2
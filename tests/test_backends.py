@@ -0,0 +1,59 @@
+'''
+Checks of the backend registry: calibration files and tier selection
+'''
+import json
+import os
+import pytest
+from backends import (BACKENDS, get_backend, load_calibration, machine_id, save_calibration,
+                      select_backend)
+
+
+# Made up calibration: seconds and error of some backends that are always
+# available
+RESULTS = {'spline1': {'seconds': .01, 'error': 5e-3},
+           'spline3': {'seconds': .03, 'error': 8e-4},
+           'spline5': {'seconds': .05, 'error': 0.},
+           'bin': {'seconds': .005, 'error': .05},
+           'not-a-backend': {'seconds': 0., 'error': 0.}}
+
+
+def test_calibration_round_trip_keeps_other_machines(tmpdir):
+    path = str(tmpdir.join('cache', 'backends.json'))
+    assert load_calibration(path) is None
+    save_calibration({'bin': {'seconds': 1., 'error': 1.}}, path)
+    # Another machine sharing the cache directory
+    with open(path) as f:
+        calibrations = json.load(f)
+    calibrations['other'] = {'backends': {}}
+    with open(path, 'w') as f:
+        json.dump(calibrations, f)
+    save_calibration(RESULTS, path)
+    assert load_calibration(path)['backends'] == RESULTS
+    with open(path) as f:
+        assert sorted(json.load(f)) == sorted(['other', machine_id()])
+    assert os.listdir(str(tmpdir.join('cache'))) == ['backends.json']
+
+
+@pytest.mark.parametrize('tier, name', [('exact', 'spline5'), ('high', 'spline3'),
+                                        ('fast', 'spline1'), ('preview', 'bin')])
+def test_select_backend_picks_the_fastest_of_the_tier(tmpdir, tier, name):
+    path = str(tmpdir.join('backends.json'))
+    save_calibration(RESULTS, path)
+    assert select_backend(tier, path=path) is BACKENDS[name]
+
+
+def test_select_backend_falls_back_to_the_cubic_spline(tmpdir):
+    path = str(tmpdir.join('backends.json'))
+    save_calibration({'bin': RESULTS['bin']}, path)
+    assert select_backend('exact', path=path) is BACKENDS['spline3']
+    with pytest.raises(ValueError):
+        select_backend('perfect', path=path)
+
+
+def test_get_backend_names_and_defaults():
+    assert get_backend(None) is BACKENDS['spline3']
+    assert get_backend(None, 'bin') is BACKENDS['bin']
+    assert get_backend('spline1') is BACKENDS['spline1']
+    assert get_backend(BACKENDS['bin']) is BACKENDS['bin']
+    with pytest.raises(ValueError):
+        get_backend('no-such-backend')
@@ -0,0 +1,55 @@
+'''
+Checks that the catalog index only rescans files that changed
+'''
+import json
+import os
+import numpy
+import pytest
+from catalog import Catalog
+from catalogindex import CatalogIndex
+
+# FITS files decode without scipy.misc, which newer scipy no longer has
+fits = pytest.importorskip('astropy.io.fits')
+
+
+def write_image(path, shape, seed=0, mtime=None):
+    data = numpy.random.RandomState(seed).rand(*shape).astype(numpy.float32)
+    fits.PrimaryHDU(data).writeto(path, overwrite=True)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def make_catalog(tmpdir, names):
+    records = [{'name': name, 'path': name + '.fits', 'pixscale': .05} for name in names]
+    manifest = str(tmpdir.join('catalog.json'))
+    with open(manifest, 'w') as f:
+        json.dump(records, f)
+    return Catalog(manifest)
+
+
+def test_update_skips_unchanged_files(tmpdir):
+    for seed, name in enumerate(['a', 'b']):
+        write_image(str(tmpdir.join(name + '.fits')), (60, 80), seed, mtime=1e9)
+    catalog = make_catalog(tmpdir, ['a', 'b'])
+    path = str(tmpdir.join('index.npz'))
+    index = CatalogIndex(catalog, path)
+    assert sorted(index.update()) == ['a', 'b']
+    assert index.update() == []
+    assert index.record('a')['shape'] == [60, 80]
+    assert index.thumbnail('a').dtype == numpy.uint8
+    # A new GUI starts from the saved index
+    index = CatalogIndex(catalog, path)
+    assert index.names() == ['a', 'b']
+    assert index.update() == []
+    # Only the changed file is scanned, and its old thumbnail goes
+    old_hash = index.record('b')['hash']
+    write_image(str(tmpdir.join('b.fits')), (40, 50), seed=5, mtime=1e9 + 10)
+    assert index.update() == ['b']
+    assert index.record('b')['shape'] == [40, 50]
+    assert old_hash not in index.thumbnails and len(index.thumbnails) == 2
+    # Files that are gone are dropped
+    os.remove(str(tmpdir.join('a.fits')))
+    index.update()
+    assert index.names() == ['b'] and index.record('a') is None
+    # No temporary files are left next to the index
+    assert sorted(os.listdir(str(tmpdir))) == ['b.fits', 'catalog.json', 'index.npz']
@@ -0,0 +1,48 @@
+'''
+Checks of the detector noise model against its expected mean and variance
+'''
+import numpy
+from detector import Detector
+
+
+def test_exposures_have_the_expected_mean_and_variance():
+    detector = Detector(flux_scale=50.)
+    frame = numpy.full((32, 32), 2., dtype=numpy.float32)
+    exptime = 10.
+    exposures = detector.expose(frame, exptime, count=500, seed=3)
+    assert exposures.shape == (500, 32, 32) and exposures.dtype == numpy.float32
+    electrons = (2. * 50. + detector.dark_current) * exptime
+    mean = detector.bias + electrons / detector.gain
+    # Shot noise, read noise and the rounding of the ADC
+    variance = (electrons + detector.read_noise ** 2) / detector.gain ** 2 + 1. / 12
+    assert abs(exposures.mean() - mean) < 5 * numpy.sqrt(variance / exposures.size)
+    assert abs(exposures.var() / variance - 1.) < .02
+
+
+def test_full_well_and_adc_range():
+    detector = Detector(full_well=1000., read_noise=0., gain=1., bias=0., adc_bits=8)
+    exposures = detector.expose(numpy.full((8, 8), 1e4), 1., count=4, seed=0)
+    assert exposures.max() == 255
+    detector.adc_bits = 16
+    assert detector.expose(numpy.full((8, 8), 1e4), 1., count=4, seed=0).max() == 1000
+
+
+def test_seeds_reproduce_exposures():
+    detector = Detector(flux_scale=20.)
+    frame = numpy.random.RandomState(0).rand(16, 16)
+    first = detector.expose(frame, 5., count=8, seed=7)
+    assert numpy.array_equal(first, detector.expose(frame, 5., count=8, seed=7))
+    assert not numpy.array_equal(first, detector.expose(frame, 5., count=8, seed=8))
+    def chunks(seed):
+        return numpy.concatenate(list(detector.exposures(frame, 5., 8, chunk=3, seed=seed)))
+    assert chunks(7).shape == first.shape
+    assert numpy.array_equal(chunks(7), chunks(7))
+
+
+def test_coadd_sums_the_exposures():
+    detector = Detector(flux_scale=20.)
+    frame = numpy.random.RandomState(0).rand(16, 16)
+    total, count = detector.coadd(frame, 5., 10, chunk=4, seed=2)
+    exposures = numpy.concatenate(list(detector.exposures(frame, 5., 10, chunk=4, seed=2)))
+    assert count == 10
+    assert numpy.allclose(total, exposures.sum(axis=0, dtype=numpy.float64) - 10 * detector.bias)
@@ -0,0 +1,60 @@
+'''
+Checks of the memory budget and LRU order of the resampled frame cache
+'''
+import numpy
+from framecache import FrameCache
+
+
+def frame(value, shape=(10, 10)):
+    return numpy.full(shape, value, dtype=numpy.float32)
+
+
+def test_hits_and_samplings_within_quantum():
+    cache = FrameCache(max_bytes=10 * frame(0).nbytes)
+    cache.put('a', .1, frame(1))
+    assert cache.get('a', .1 + 1e-5)[0, 0] == 1
+    assert cache.get('a', .2) is None
+    assert cache.get('b', .1) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['frames']) == (1, 2, 1)
+    # Previews stay out of the counts
+    cache.get('a', .3, count=False)
+    assert cache.stats()['misses'] == 2
+
+
+def test_budget_evicts_least_recently_used():
+    cache = FrameCache(max_bytes=2 * frame(0).nbytes)
+    cache.put('a', .1, frame(1))
+    cache.put('b', .1, frame(2))
+    # a is now the most recently used
+    cache.get('a', .1)
+    cache.put('c', .1, frame(3))
+    assert cache.get('b', .1) is None
+    assert cache.get('a', .1) is not None and cache.get('c', .1) is not None
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['nbytes'] == 2 * frame(0).nbytes <= stats['max_bytes']
+
+
+def test_replacing_a_frame_counts_it_once():
+    cache = FrameCache(max_bytes=10 * frame(0).nbytes)
+    cache.put('a', .1, frame(1))
+    cache.put('a', .1, frame(2))
+    assert cache.nbytes == frame(0).nbytes
+    assert cache.get('a', .1)[0, 0] == 2
+
+
+def test_oversized_frames_are_not_kept():
+    cache = FrameCache(max_bytes=frame(0).nbytes)
+    cache.put('a', .1, frame(1))
+    cache.put('big', .1, frame(2, (20, 20)))
+    assert cache.get('big', .1) is None
+    # and do not push out the frames that fit
+    assert cache.get('a', .1) is not None
+    assert cache.nbytes == frame(0).nbytes
+
+
+def test_cached_frames_are_read_only():
+    cache = FrameCache()
+    cache.put('a', .1, frame(1))
+    assert not cache.get('a', .1).flags.writeable
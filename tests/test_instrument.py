@@ -0,0 +1,53 @@
+'''
+Checks of the vectorized plate scale against the formula of the
+assessment GUI it replaced
+'''
+from collections import namedtuple
+import numpy
+from instrument import Instrument, plate_scale
+
+
+def on_clicked(objsize, imsize, master_sampling, xsize_arcsecs):
+    '''
+    The scalar onClicked of the original gui_assess: (pixscale, fov,
+    oversampled, fov_too_large)
+    '''
+    objsize *= 3600.
+    scale = objsize / imsize # arseconds / mm
+    pixscale = scale * 18.3e-6 # arcseconds / pixel. 18.3 micron pixel size of H2RG
+    fov = 2048. * pixscale
+    return pixscale, fov, not pixscale > master_sampling, not fov < xsize_arcsecs
+
+
+def test_screen_matches_the_scalar_formula():
+    objsizes = numpy.array([.001, .01, .05, .2])
+    imsizes = numpy.array([.01, .05, .3, 1.])
+    result = Instrument().screen(objsizes[:, None], imsizes[None, :], .05, 30.)
+    assert result.pixscale.shape == (4, 4)
+    for i, objsize in enumerate(objsizes):
+        for j, imsize in enumerate(imsizes):
+            pixscale, fov, oversampled, fov_too_large = on_clicked(objsize, imsize, .05, 30.)
+            assert numpy.isclose(result.pixscale[i, j], pixscale, rtol=1e-12)
+            assert numpy.isclose(result.fov[i, j], fov, rtol=1e-12)
+            assert result.oversampled[i, j] == oversampled
+            assert result.fov_too_large[i, j] == fov_too_large
+
+
+def test_focal_length_gives_the_image_size():
+    instrument = Instrument(focal_length=10.)
+    objsize = numpy.array([.01, .1])
+    pixscale, fov = instrument.plate_scale(objsize)
+    expected = plate_scale(objsize, numpy.radians(objsize) * 10.)
+    assert numpy.allclose(pixscale, expected[0]) and numpy.allclose(fov, expected[1])
+    # 206265 arcsecs per radian over 10 m, times the pitch
+    assert numpy.allclose(pixscale, 206264.806 / 10. * 18.3e-6)
+
+
+def test_screen_image_fits_the_field_in_the_narrower_side():
+    image = namedtuple('Image', ['master_sampling', 'xsize_arcsecs', 'ysize_arcsecs'])
+    instrument = Instrument()
+    # fov is 2048 * .01 * 3600 / .1 * 18.3e-6 = 13.5 arcsecs
+    wide = instrument.screen_image(.01, .1, image(.05, 40., 10.))
+    tall = instrument.screen_image(.01, .1, image(.05, 10., 40.))
+    assert bool(wide.fov_too_large) and bool(tall.fov_too_large)
+    assert not instrument.screen_image(.01, .1, image(.05, 40., 40.)).fov_too_large
@@ -0,0 +1,47 @@
+'''
+Checks that tiled, multi-threaded resampling matches a single window
+'''
+import numpy
+import pytest
+from kernels import resampled_shape, spline_coefficients, zoom_tiled, zoom_window
+
+
+def random_image(shape, dtype=numpy.float32, seed=0):
+    rng = numpy.random.RandomState(seed)
+    image = rng.rand(*shape) * 255
+    return image.astype(dtype)
+
+
+@pytest.mark.parametrize('prefiltered', [False, True])
+@pytest.mark.parametrize('zoom_factor', [.37, 1.9])
+def test_zoom_tiled_matches_single_window(prefiltered, zoom_factor):
+    image = random_image((300, 260, 3))
+    if prefiltered:
+        image = spline_coefficients(image, threads=3)
+    ny, nx = resampled_shape(image.shape, zoom_factor)
+    rows, cols = (ny // 5, ny - 3), (2, nx)
+    single = zoom_window(image, zoom_factor, rows, cols, prefiltered=prefiltered)
+    tiled = zoom_tiled(image, zoom_factor, rows, cols, threads=4, tile=64, prefiltered=prefiltered)
+    if prefiltered:
+        assert numpy.array_equal(single, tiled)
+    else:
+        # Each tile prefilters its own halo, which is exact to about 0.268 ** halo
+        assert numpy.allclose(single, tiled, atol=255 * .268 ** 8)
+
+
+def test_spline_coefficients_do_not_depend_on_threads():
+    image = random_image((200, 150))
+    assert numpy.array_equal(spline_coefficients(image, threads=1), spline_coefficients(image, threads=4))
+
+
+@pytest.mark.parametrize('shape, out_shape', [((154, 151), (205, 201)), ((386, 55), (521, 74)),
+                                              ((38, 218), (102, 585))])
+def test_nearest_zoom_tiles_match_single_window(shape, out_shape):
+    image = random_image(shape + (3,), numpy.uint8)
+    zoom_factor = out_shape[0] / float(shape[0])
+    assert resampled_shape(shape, zoom_factor) == out_shape
+    rows, cols = (3, out_shape[0]), (0, out_shape[1] - 1)
+    single = zoom_window(image, zoom_factor, rows, cols, order=0)
+    # Small tiles put many rounding ties on tile edges
+    tiled = zoom_tiled(image, zoom_factor, rows, cols, threads=4, tile=7, order=0)
+    assert numpy.array_equal(single, tiled)
@@ -0,0 +1,63 @@
+'''
+Checks of the kernel spectra cache shared between ImageObjects
+'''
+import threading
+import time
+from psf import GaussianPSF, SpectrumCache, kernel_halo
+
+
+class SlowPSF(GaussianPSF):
+    '''
+    Gaussian PSF whose kernel takes long enough for threads to miss together
+    '''
+    def kernel(self, sampling):
+        time.sleep(.1)
+        return GaussianPSF.kernel(self, sampling)
+
+
+class CountingPSF(GaussianPSF):
+    '''
+    Gaussian PSF that counts the kernels it builds
+    '''
+    calls = 0
+    def kernel(self, sampling):
+        self.calls += 1
+        return GaussianPSF.kernel(self, sampling)
+
+
+def test_concurrent_misses_are_counted_once():
+    spectra = SpectrumCache()
+    psf = SlowPSF(1.)
+    entries = []
+    threads = [threading.Thread(target=lambda: entries.append(spectra.get(psf, .2, (64, 64))))
+               for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(spectra.spectra) == 1
+    assert spectra.nbytes == entries[0][0].nbytes
+    assert all(entry is entries[0] for entry in entries)
+
+
+def test_budget_evicts_oldest_spectra():
+    psf = GaussianPSF(1.)
+    nbytes = SpectrumCache().get(psf, .2, (64, 64))[0].nbytes
+    spectra = SpectrumCache(max_bytes=2 * nbytes)
+    for sampling in (.2, .21, .22):
+        spectra.get(psf, sampling, (64, 64))
+    assert spectra.nbytes <= spectra.max_bytes
+    assert len(spectra.spectra) == 2
+
+
+def test_kernel_halo_builds_the_kernel_once():
+    spectra = SpectrumCache()
+    psf = CountingPSF(1.)
+    halos = [kernel_halo(psf, .2, spectra) for n in range(3)]
+    assert halos == [max(GaussianPSF(1.).kernel(.2).shape) // 2] * 3
+    spectra.get(psf, .2, (64, 64))
+    assert psf.calls == 2
+    # Shapes from spectra built first are reused too
+    spectra.get(psf, .3, (64, 64))
+    kernel_halo(psf, .3, spectra)
+    assert psf.calls == 3
@@ -0,0 +1,34 @@
+'''
+Checks that regions resampled for the viewport match the full frame
+'''
+import numpy
+import pytest
+from psf import GaussianPSF
+from resample import ImageObject
+
+
+def random_image(shape, dtype=numpy.float32, seed=0):
+    rng = numpy.random.RandomState(seed)
+    image = rng.rand(*shape) * 255
+    return image.astype(dtype)
+
+
+def region_indices(obj, frame, extent, full):
+    '''
+    (rows, cols) slices of full under a resampled_region frame and extent
+    '''
+    ny, nx = full.shape[:2]
+    x0 = int(round((extent[0] + obj.xsize_arcsecs / 2.) / (obj.xsize_arcsecs / nx)))
+    y0 = int(round((obj.ysize_arcsecs / 2. - extent[3]) / (obj.ysize_arcsecs / ny)))
+    return slice(y0, y0 + frame.shape[0]), slice(x0, x0 + frame.shape[1])
+
+
+@pytest.mark.parametrize('psf', [None, GaussianPSF(.3), GaussianPSF(.06)])
+@pytest.mark.parametrize('method', ['spline', 'bin'])
+@pytest.mark.parametrize('sampling', [.031, .07, .13])
+def test_region_matches_full_frame(psf, method, sampling):
+    obj = ImageObject(random_image((400, 300)), .05, method=method, psf=psf)
+    full = obj.resampled(sampling)
+    frame, extent = obj.resampled_region(sampling, (-4., 6.), (-3., 2.5))
+    rows, cols = region_indices(obj, frame, extent, full)
+    assert numpy.allclose(frame, full[rows, cols], atol=1e-3)
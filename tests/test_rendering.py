@@ -0,0 +1,47 @@
+'''
+Checks that frames are binned down to the screen pixels of the axes
+'''
+import numpy
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from rendering import decimate_to_axes
+
+
+def square_axes(extent, pixels=200):
+    '''
+    Axes pixels x pixels on screen showing all of extent
+    '''
+    fig = Figure((2., 2.), dpi=pixels / 2.)
+    FigureCanvasAgg(fig)
+    axes = fig.add_axes([0, 0, 1, 1])
+    axes.set_xlim(extent[0], extent[1])
+    axes.set_ylim(extent[2], extent[3])
+    return axes
+
+
+def test_large_frames_are_averaged_down_to_the_screen():
+    extent = [-5., 5., -5., 5.]
+    frame = numpy.random.RandomState(0).rand(1000, 1000).astype(numpy.float32)
+    binned, new_extent = decimate_to_axes(frame, extent, square_axes(extent))
+    assert binned.shape == (200, 200) and binned.dtype == frame.dtype
+    assert numpy.allclose(binned[0, 0], frame[:5, :5].mean())
+    assert numpy.allclose(new_extent, extent)
+
+
+def test_incomplete_blocks_are_cut_from_the_extent():
+    extent = [0., 10.12, 0., 10.33]
+    frame = numpy.ones((1033, 1012, 3), dtype=numpy.uint8)
+    binned, new_extent = decimate_to_axes(frame, extent, square_axes(extent))
+    assert binned.shape == (206, 202, 3) and binned.dtype == numpy.uint8
+    # Pixels are .01 arcsecs: the last 2 columns and 3 rows are dropped,
+    # the left and top edges stay put
+    assert numpy.allclose(new_extent, [0., 10.1, .03, 10.33])
+
+
+def test_zooming_in_keeps_the_frame():
+    extent = [-5., 5., -5., 5.]
+    frame = numpy.zeros((1000, 1000), dtype=numpy.float32)
+    # Only a fifth of the frame is on screen, so every pixel shows
+    axes = square_axes([-1., 1., -1., 1.])
+    result, new_extent = decimate_to_axes(frame, extent, axes)
+    assert result is frame and new_extent == extent
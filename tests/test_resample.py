@@ -0,0 +1,38 @@
+'''
+Checks of the flux kept by binning and of its speed against spline zooms
+'''
+import time
+import numpy
+import pytest
+from scipy.ndimage import zoom
+from kernels import bin_resample, resampled_shape
+
+
+def random_image(shape, dtype=numpy.float32, seed=0):
+    rng = numpy.random.RandomState(seed)
+    image = rng.rand(*shape) * 255
+    return image.astype(dtype)
+
+
+@pytest.mark.parametrize('zoom_factor', [2, 4, 1 / .3, 1 / .75])
+@pytest.mark.parametrize('shape', [(300, 240), (300, 240, 3)])
+def test_bin_resample_conserves_flux(zoom_factor, shape):
+    image = random_image(shape)
+    frame = bin_resample(image, 1. / zoom_factor)
+    # Every factor tiles the image exactly, so all of the flux is kept
+    assert frame.shape[:2] == resampled_shape(shape, 1. / zoom_factor, 'bin')
+    assert numpy.allclose(frame.sum(axis=(0, 1)), image.sum(axis=(0, 1)), rtol=1e-5)
+    mean = bin_resample(image, 1. / zoom_factor, conserve_flux=False)
+    assert numpy.allclose(mean.mean(axis=(0, 1)), image.mean(axis=(0, 1)), rtol=1e-5)
+
+
+def test_bin_resample_is_faster_than_spline_zoom():
+    image = random_image((1024, 1024))
+    def best(function):
+        times = []
+        for n in range(3):
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+        return min(times)
+    assert best(lambda: bin_resample(image, .37)) < best(lambda: zoom(image, .37))
@@ -0,0 +1,27 @@
+'''
+Checks that streamed resampling of memmapped masters matches ImageObject
+'''
+import numpy
+import pytest
+from psf import GaussianPSF
+from resample import ImageObject
+from streaming import stream_resample
+
+
+def random_image(shape, dtype=numpy.float32, seed=0):
+    rng = numpy.random.RandomState(seed)
+    image = rng.rand(*shape) * 255
+    return image.astype(dtype)
+
+
+@pytest.mark.parametrize('psf', [None, GaussianPSF(.3)])
+@pytest.mark.parametrize('method', ['spline', 'bin'])
+@pytest.mark.parametrize('sampling', [.031, .07, .2])
+def test_stream_matches_resampled(tmpdir, psf, method, sampling):
+    image = random_image((500, 420))
+    master = str(tmpdir.join('master.npy'))
+    numpy.save(master, image)
+    obj = ImageObject(image, .05, method=method, psf=psf)
+    frame = stream_resample(numpy.load(master, mmap_mode='r'), .05, sampling,
+                            str(tmpdir.join('frame.npy')), method, psf, strip_rows=64)
+    assert numpy.allclose(frame, obj.resampled(sampling), atol=1e-3)
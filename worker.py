@@ -0,0 +1,124 @@
+import multiprocessing
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+
+class ResampleWorker(threading.Thread):
+    '''
+    Runs resampling jobs off the GUI thread. Requests are coalesced: a new
+    submit replaces any job that has not started yet, and the result of a
+    job that was superseded while running is dropped. To use:
+    worker = ResampleWorker()
+    worker.start()
+    worker.submit(obj.resampled, sampling)
+    result = worker.poll() # None until the latest job is done
+    '''
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.pending = None
+        self.result = None
+        self.running = True
+    def submit(self, job, *args):
+        '''
+        Queues job(*args), cancelling whatever was queued before.
+        Returns the generation number of the request.
+        '''
+        with self.condition:
+            self.generation += 1
+            self.pending = (self.generation, job, args)
+            self.result = None
+            self.condition.notify()
+            return self.generation
+    def cancel(self):
+        '''
+        Drops the queued job and the result of the running one
+        '''
+        with self.condition:
+            self.generation += 1
+            self.pending = None
+            self.result = None
+    def is_current(self, generation):
+        return generation == self.generation
+    def poll(self):
+        '''
+        Returns (value, error) of the latest request once, or None
+        '''
+        with self.condition:
+            result = self.result
+            self.result = None
+            return result
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                generation, job, args = self.pending
+                self.pending = None
+            try:
+                result = (job(*args), None)
+            except Exception as error:
+                result = (None, error)
+            with self.condition:
+                if generation == self.generation:
+                    self.result = result
+
+
+class ResampleService:
+    '''
+    Resamples for several panels at once. A batch maps each panel to
+    (key, job, args); jobs with the same key, e.g. two panels showing the
+    same image, are run once. The distinct jobs run concurrently on a thread
+    pool, and like ResampleWorker a new batch supersedes the previous one.
+    service = ResampleService()
+    service.submit({'left': (key, obj.resampled_region, (sampling, xlim, ylim))})
+    results = service.poll() # None until the batch is done, then
+                             # {'left': (value, error)}
+    '''
+    def __init__(self, threads=None):
+        self.pool = ThreadPool(threads or multiprocessing.cpu_count())
+        self.worker = ResampleWorker()
+        self.worker.start()
+    def run_batch(self, batch):
+        jobs = OrderedDict()
+        for key, job, args in batch.values():
+            jobs.setdefault(key, (job, args))
+        def run(item):
+            job, args = item
+            try:
+                return (job(*args), None)
+            except Exception as error:
+                return (None, error)
+        results = dict(zip(jobs, self.pool.map(run, list(jobs.values()))))
+        return dict((panel, results[key]) for panel, (key, job, args) in batch.items())
+    def submit(self, batch):
+        '''
+        Queues the batch, cancelling whatever was queued before.
+        Returns the generation number of the request.
+        '''
+        return self.worker.submit(self.run_batch, dict(batch))
+    def cancel(self):
+        self.worker.cancel()
+    def poll(self):
+        '''
+        Returns {panel: (value, error)} of the latest batch once, or None
+        '''
+        result = self.worker.poll()
+        if result is None:
+            return None
+        results, error = result
+        if error is not None:
+            raise error
+        return results
+    def stop(self):
+        self.worker.stop()
+        self.pool.close()